@@ -1,5 +1,9 @@
 from flask import Flask, request, abort
+import hashlib
 import json
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
 from jose import jwt
 from urllib.request import urlopen
@@ -7,9 +11,10 @@ from urllib.request import urlopen
 
 app = Flask(__name__)
 
-AUTH0_DOMAIN = @TODO_REPLACE_WITH_YOUR_DOMAIN
+AUTH0_DOMAIN = '@TODO_REPLACE_WITH_YOUR_DOMAIN'
 ALGORITHMS = ['RS256']
-API_AUDIENCE = @TODO_REPLACE_WITH_YOUR_API_AUDIENCE
+API_AUDIENCE = '@TODO_REPLACE_WITH_YOUR_API_AUDIENCE'
+TOKEN_CACHE_SIZE = 1024
 
 
 class AuthError(Exception):
@@ -18,6 +23,46 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+class TokenCache:
+    """Verified JWT payloads, keyed by SHA-256 of the token and kept until its exp.
+
+    Bounded to max_size entries, least recently used first out.
+    """
+
+    def __init__(self, max_size=TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        key = hashlib.sha256(token.encode('utf-8')).digest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token, payload):
+        exp = payload.get('exp')
+        if not isinstance(exp, (int, float)):
+            return
+        key = hashlib.sha256(token.encode('utf-8')).digest()
+        with self._lock:
+            self._entries[key] = (payload, exp)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+token_cache = TokenCache()
+
+
 def get_token_auth_header():
     """Obtains the Access Token from the Authorization Header
     """
@@ -105,12 +150,22 @@ def verify_decode_jwt(token):
             }, 400)
 
 
+def verify_token(token):
+    """Returns the cached payload for a token verified before, else verifies it.
+    """
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = verify_decode_jwt(token)
+        token_cache.put(token, payload)
+    return payload
+
+
 def requires_auth(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
         token = get_token_auth_header()
         try:
-            payload = verify_decode_jwt(token)
+            payload = verify_token(token)
         except:
             abort(401)
         return f(payload, *args, **kwargs)
@@ -0,0 +1,73 @@
+import time
+import unittest
+from unittest import mock
+
+import app
+from app import TokenCache, verify_token
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    """Runs without Auth0: verify_decode_jwt is replaced where a verified token is needed.
+
+        python -m unittest test_app
+    """
+
+    def payload(self, exp):
+        payload = {'sub': 'auth0|test'}
+        if exp is not None:
+            payload['exp'] = exp
+        return payload
+
+    def test_counts_hits_and_misses(self):
+        cache = TokenCache()
+        payload = self.payload(time.time() + 60)
+
+        self.assertIsNone(cache.get('token'))
+        cache.put('token', payload)
+        self.assertIs(cache.get('token'), payload)
+        self.assertIs(cache.get('token'), payload)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_expires_at_exp(self):
+        cache = TokenCache()
+        now = time.time()
+        cache.put('token', self.payload(now + 60))
+
+        with mock.patch.object(app.time, 'time', return_value=now + 59):
+            self.assertIsNotNone(cache.get('token'))
+        with mock.patch.object(app.time, 'time', return_value=now + 60):
+            self.assertIsNone(cache.get('token'))
+        self.assertEqual(len(cache._entries), 0)
+
+    def test_token_without_exp_is_not_cached(self):
+        cache = TokenCache()
+        cache.put('token', self.payload(None))
+
+        self.assertEqual(len(cache._entries), 0)
+        self.assertIsNone(cache.get('token'))
+
+    def test_evicts_least_recently_used(self):
+        cache = TokenCache(max_size=2)
+        exp = time.time() + 60
+        for token in ('a', 'b'):
+            cache.put(token, self.payload(exp))
+        cache.get('a') # 'b' is now the least recently used
+        cache.put('c', self.payload(exp))
+
+        self.assertEqual(len(cache._entries), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_cached_token_skips_verification(self):
+        payload = self.payload(time.time() + 60)
+        with mock.patch.object(app, 'token_cache', TokenCache()), \
+                mock.patch.object(app, 'verify_decode_jwt', return_value=payload) as verify_decode_jwt:
+            self.assertIs(verify_token('token'), payload)
+            self.assertIs(verify_token('token'), payload)
+
+        verify_decode_jwt.assert_called_once_with('token')
+
+
+if __name__ == '__main__':
+    unittest.main()
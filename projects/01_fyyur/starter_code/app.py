@@ -5,16 +5,28 @@
 import json
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify
+from babel.dates import parse_pattern
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, abort, stream_with_context
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.associationproxy import association_proxy
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from flask_migrate import Migrate
+from search import NameSearch
+from cache import PageCache
+from pool import pool_metrics
+from metrics import RequestMetrics
+from show_import import import_shows, read_rows, format_for
+import click
+import io
 import sys
 from datetime import datetime
+from itertools import groupby
+from functools import lru_cache
 
 #----------------------------------------------------------------------------#
 # App Config.
@@ -25,6 +37,13 @@ moment = Moment(app)
 app.config.from_object('config')
 db = SQLAlchemy(app)
 migrate = Migrate(app,db)
+name_search = NameSearch(db)
+page_cache = PageCache()
+request_metrics = RequestMetrics(app, namespace='fyyur')
+
+SEARCH_RESULTS_LIMIT = 100 # max hits rendered per search request, use the 'offset' form field to page
+SHOWS_PER_PAGE = 30
+EXPORT_BATCH_SIZE = 1000 # rows fetched per round-trip from the server-side cursor
 
 # TODO: connect to a local postgresql database - [DONE]
 
@@ -32,9 +51,50 @@ migrate = Migrate(app,db)
 # Models.
 #----------------------------------------------------------------------------#
 
+class Genre(db.Model):
+  __tablename__ = 'genre'
+
+  id = db.Column(db.Integer, primary_key=True)
+  name = db.Column(db.String(120), nullable=False, unique=True)
+
+  @classmethod
+  def named(cls, name):
+    '''The genre called name, created if it doesn't exist yet.'''
+    with db.session.no_autoflush:
+      genre = cls.query.filter_by(name=name).one_or_none()
+    if genre is not None:
+      return genre
+    try:
+      # flushed in a savepoint so a concurrent insert of the same name only undoes this one
+      with db.session.begin_nested():
+        genre = cls(name=name)
+        db.session.add(genre)
+    except IntegrityError:
+      with db.session.no_autoflush:
+        genre = cls.query.filter_by(name=name).one()
+    return genre
+
+  def __repr__(self):
+    return f'<Genre {self.id} {self.name}>'
+
+# (genre_id, venue_id) / (genre_id, artist_id) indexes serve "venues/artists by genre",
+# the primary keys serve "genres of a venue/artist"
+venue_genre = db.Table('venue_genre',
+  db.Column('venue_id', db.Integer, db.ForeignKey('venue.id', ondelete='CASCADE'), primary_key=True),
+  db.Column('genre_id', db.Integer, db.ForeignKey('genre.id', ondelete='CASCADE'), primary_key=True),
+  db.Index('ix_venue_genre_genre_id_venue_id', 'genre_id', 'venue_id'))
+
+artist_genre = db.Table('artist_genre',
+  db.Column('artist_id', db.Integer, db.ForeignKey('artist.id', ondelete='CASCADE'), primary_key=True),
+  db.Column('genre_id', db.Integer, db.ForeignKey('genre.id', ondelete='CASCADE'), primary_key=True),
+  db.Index('ix_artist_genre_genre_id_artist_id', 'genre_id', 'artist_id'))
+
 
 class Venue(db.Model):
     __tablename__ = 'venue'
+    __table_args__ = (
+      db.Index('ix_venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -47,7 +107,9 @@ class Venue(db.Model):
     facebook_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, default=True)
     seeking_description = db.Column(db.Text)
-    genres = db.Column(db.PickleType, nullable=False)
+    genre_rows = db.relationship('Genre', secondary=venue_genre, lazy='selectin', order_by='Genre.name')
+    # list of genre names, assigning a list of names links (and creates) the genres
+    genres = association_proxy('genre_rows', 'name', creator=Genre.named)
     shows = db.relationship('Show', backref='venue', lazy=True)
 
 
@@ -59,13 +121,17 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'artist'
+    __table_args__ = (
+      db.Index('ix_artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120), nullable=False)
-    genres = db.Column(db.PickleType, nullable=False)
+    genre_rows = db.relationship('Genre', secondary=artist_genre, lazy='selectin', order_by='Genre.name')
+    genres = association_proxy('genre_rows', 'name', creator=Genre.named)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=True)
@@ -78,6 +144,12 @@ class Artist(db.Model):
 
 class Show(db.Model):
   __tablename__ = 'show'
+  # every show lookup filters on one foreign key plus a start_time range
+  __table_args__ = (
+    db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+    db.Index('ix_show_start_time_id', 'start_time', 'id'),
+  )
 
   id = db.Column(db.Integer, primary_key=True)
   venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'))
@@ -86,43 +158,207 @@ class Show(db.Model):
 
   def __repr__(self):
     return f'<Show {self.id} {self.venue_id} {self.artist_id}>'
- 
+
+name_search.watch(Venue)
+name_search.watch(Artist)
 
 #----------------------------------------------------------------------------#
 # My helper functions
 #----------------------------------------------------------------------------#
 
 
-def count_upcoming_shows(id):
-  return Show.query.filter_by(venue_id=id).filter(Show.start_time >  datetime.now()).count()
+def venues_by_area(genre=None):
+  '''Builds the city/state -> venues -> upcoming show count directory, optionally
+  only for venues of one genre.
+  Everything comes from a single LEFT JOIN ... GROUP BY query, so the number of
+  round-trips stays the same no matter how many venues or areas exist.'''
+  now = datetime.now()
+  query = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, db.func.count(Show.id)) \
+    .outerjoin(Show, db.and_(Show.venue_id == Venue.id, Show.start_time > now))
+  if genre is not None:
+    query = query.filter(Venue.genre_rows.any(Genre.name == genre))
+  rows = query.group_by(Venue.id, Venue.name, Venue.city, Venue.state) \
+    .order_by(Venue.city, Venue.state, Venue.id).all()
+  areas = []
+  for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+    areas.append({
+      'city': city,
+      'state': state,
+      'venues': [{'id': v.id, 'name': v.name, 'num_upcoming_shows': v[4]} for v in venues]
+    })
+  return areas
+
+
+def show_timelines(ids, by='venue', now=None):
+  '''Loads the past/upcoming shows of many venues (by='venue') or artists (by='artist').
+  All shows come back from one query and are split in memory against a single
+  timestamp, so lists and counts are always consistent with each other.'''
+  now = now or datetime.now()
+  timelines = {id: {'past_shows': [], 'upcoming_shows': []} for id in ids}
+  if by == 'venue':
+    owner_id, other_id, other, prefix = Show.venue_id, Show.artist_id, Artist, 'artist'
+  else:
+    owner_id, other_id, other, prefix = Show.artist_id, Show.venue_id, Venue, 'venue'
+  if timelines:
+    rows = db.session.query(owner_id, Show.start_time, other.id, other.name, other.image_link) \
+      .join(other, other_id == other.id) \
+      .filter(owner_id.in_(timelines.keys())) \
+      .order_by(Show.start_time).all()
+    for owner, start_time, id, name, image_link in rows:
+      bucket = 'upcoming_shows' if start_time > now else 'past_shows'
+      timelines[owner][bucket].append({prefix + '_id': id, prefix + '_name': name,
+                                       prefix + '_image_link': image_link,
+                                       'start_time': start_time})
+  for timeline in timelines.values():
+    timeline['past_shows_count'] = len(timeline['past_shows'])
+    timeline['upcoming_shows_count'] = len(timeline['upcoming_shows'])
+  return timelines
+
+def show_timeline(id, by='venue'):
+  return show_timelines([id], by=by)[id]
+
+def search_by_name(model, search_term, limit=SEARCH_RESULTS_LIMIT, offset=0):
+  '''Case-insensitive partial name search over venues or artists, best match first.
+  Hits, their upcoming show counts and the total number of matches (via
+  COUNT(*) OVER ()) all come back from one query; limit/offset bound how many
+  rows are materialized for broad terms. Both come from the form, so they are
+  clamped to 1..SEARCH_RESULTS_LIMIT and >= 0.'''
+  limit = min(max(limit, 1), SEARCH_RESULTS_LIMIT)
+  offset = max(offset, 0)
+  now = datetime.now()
+  owner_id = Show.venue_id if model is Venue else Show.artist_id
+  query = db.session.query(model.id, model.name, db.func.count(Show.id), db.func.count().over()) \
+    .outerjoin(Show, db.and_(owner_id == model.id, Show.start_time > now)) \
+    .group_by(model.id, model.name)
+  rows = name_search.apply(query, model, search_term).limit(limit).offset(offset).all()
+  if rows:
+    count = rows[0][3]
+  elif offset:
+    count = name_search.apply(model.query, model, search_term).count() # paged past the end: the window had no row to ride on
+  else:
+    count = 0
+  return {
+    "count": count,
+    "data": [{"id": id, "name": name, "num_upcoming_shows": num_upcoming_shows}
+             for id, name, num_upcoming_shows, _ in rows]
+  }
+
+
+
+def shows_page(after=None, upcoming_only=False, limit=SHOWS_PER_PAGE):
+  '''One page of the show listing ordered by (start_time, id), plus the cursor of the next page.
+  A single joined query selects only the displayed columns. `after` is the
+  (start_time, id) of the last show already listed; seeking past it through the
+  (start_time, id) index makes every page cost the same, however deep.'''
+  query = db.session.query(Show.id, Show.start_time, Venue.id, Venue.name, Artist.id, Artist.name, Artist.image_link) \
+    .join(Venue, Show.venue_id == Venue.id) \
+    .join(Artist, Show.artist_id == Artist.id)
+  if upcoming_only:
+    query = query.filter(Show.start_time > datetime.now())
+  if after is not None:
+    query = query.filter(db.tuple_(Show.start_time, Show.id) > db.tuple_(*after))
+  rows = query.order_by(Show.start_time, Show.id).limit(limit + 1).all()
+  data = []
+  for show_id, start_time, venue_id, venue_name, artist_id, artist_name, artist_image_link in rows[:limit]:
+    data.append({
+      "venue_id": venue_id,
+      "venue_name": venue_name,
+      "artist_id": artist_id,
+      "artist_name": artist_name,
+      "artist_image_link": artist_image_link,
+      "start_time": start_time
+      })
+  next_after = (rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+  return data, next_after
+
+
+
+def in_batches(rows, size):
+  batch = []
+  for row in rows:
+    batch.append(row)
+    if len(batch) == size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+
+def genre_names(table, key, ids):
+  '''id -> sorted genre names for a batch of venue or artist ids, in one query.'''
+  names = {}
+  query = db.session.query(key, Genre.name).join(Genre, table.c.genre_id == Genre.id) \
+    .filter(key.in_(ids)).order_by(key, Genre.name)
+  for id, name in query:
+    names.setdefault(id, []).append(name)
+  return names
 
 
-def count_past_shows(id):
-  return Show.query.filter_by(venue_id=id).filter(Show.start_time <  datetime.now()).count()
+def export_lines(model, genre_table=None, genre_key=None, batch_size=EXPORT_BATCH_SIZE):
+  '''Yields every row of model as one line of JSON, in id order.
+  Rows are read through a server-side cursor (yield_per) as plain column tuples,
+  so memory stays flat however big the table is. Genres are fetched with one
+  extra query per batch.'''
+  columns = list(model.__table__.columns)
+  keys = [column.key for column in columns]
+  rows = db.session.query(*columns).order_by(model.id).yield_per(batch_size)
+  for batch in in_batches(rows, batch_size):
+    genres = genre_names(genre_table, genre_key, [row.id for row in batch]) if genre_table is not None else None
+    lines = []
+    for row in batch:
+      record = dict(zip(keys, row))
+      if genres is not None:
+        record['genres'] = genres.get(row.id, [])
+      lines.append(json.dumps(record, default=lambda value: value.isoformat()) + '\n')
+    yield ''.join(lines)
 
-def upcoming_shows(id):
-  upcoming_shows = [] 
-  shows = db.session.query(Show, Artist).join(Show,Show.artist_id==Artist.id).filter(Show.venue_id==id, Show.start_time > datetime.now()).all()
-  for show in shows:
-    upcoming_shows.append({"artist_id": show[1].id, "artist_name": show[1].name, \
-                          "artist_image_link": show[1].image_link, "start_time": (show[0].start_time).strftime("%Y-%m-%dT%H:%M:%S")})
-  return upcoming_shows
 
-def past_shows(id):
-  past_shows = [] 
-  shows = db.session.query(Show, Artist).join(Show,Show.artist_id==Artist.id).filter(Show.venue_id==id, Show.start_time < datetime.now()).all()
-  for show in shows:
-    past_shows.append({"artist_id": show[1].id, "artist_name": show[1].name, \
-                          "artist_image_link": show[1].image_link, "start_time": (show[0].start_time).strftime("%Y-%m-%dT%H:%M:%S")})
-  return past_shows
+def ndjson_response(lines):
+  return Response(stream_with_context(lines), mimetype='application/x-ndjson')
 
-def past_shows_artist(id):
-  past_shows = [] 
-  shows = db.session.query(Show, Venue).join(Show,Show.venue_id==Venue.id).filter(Show.artist_id==id, Show.start_time < datetime.now()).all()
-  for show in shows:
-    past_shows.append({"venue_id": show[1].id, "venue_name": show[1].name, \
-                          "venue_image_link": show[1].image_link, "start_time": (show[0].start_time).strftime("%Y-%m-%dT%H:%M:%S")})
-  return past_shows
+
+
+def next_show_start(venue_id=None, artist_id=None):
+  '''Start of the next upcoming show, of one venue or artist if given. Pages that
+  list it as upcoming go stale at that moment.'''
+  query = db.session.query(db.func.min(Show.start_time)).filter(Show.start_time > datetime.now())
+  if venue_id is not None:
+    query = query.filter(Show.venue_id == venue_id)
+  if artist_id is not None:
+    query = query.filter(Show.artist_id == artist_id)
+  return query.scalar()
+
+
+def related_ids(column, other, id):
+  '''Distinct ids in the other show column for shows where column == id, e.g. artists who played a venue.'''
+  return [other_id for other_id, in db.session.query(other).filter(column == id).distinct()]
+
+
+def form_genres():
+  '''The genre names picked in the submitted form, each once: a genre linked twice breaks the association's key.'''
+  return list(dict.fromkeys(request.form.getlist('genres')))
+
+
+def venue_changed(venue_id, artist_ids=()):
+  # the venue's name and picture appear on its page, the listings and its artists' pages
+  page_cache.invalidate('venue', [venue_id])
+  page_cache.invalidate('artist', artist_ids)
+  page_cache.invalidate('venues')
+  page_cache.invalidate('shows')
+
+
+def artist_changed(artist_id, venue_ids=()):
+  page_cache.invalidate('artist', [artist_id])
+  page_cache.invalidate('venue', venue_ids)
+  page_cache.invalidate('artists')
+  page_cache.invalidate('shows')
+
+
+def show_added(venue_id, artist_id):
+  page_cache.invalidate('venue', [venue_id])
+  page_cache.invalidate('artist', [artist_id])
+  page_cache.invalidate('venues') # upcoming show counts
+  page_cache.invalidate('shows')
 
 
 
@@ -130,13 +366,29 @@ def past_shows_artist(id):
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+# the patterns above hold English literals ('at'), so pages render in English whatever
+# the server's LANG; other locales are opt-in per call: {{ show.start_time|datetime('full', 'de') }}
+DATETIME_LOCALE = 'en'
+
+@lru_cache(maxsize=None)
+def datetime_pattern(format, locale):
+  '''Compiled Babel pattern and parsed locale, built once per (format, locale).'''
+  return parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+@lru_cache(maxsize=4096)
+def _format_datetime(value, format, locale):
+  pattern, locale = datetime_pattern(format, locale)
+  return pattern.apply(value, locale)
+
+def format_datetime(value, format='medium', locale=DATETIME_LOCALE):
+  # views pass datetime objects; strings are still accepted for ad hoc use
+  if not isinstance(value, datetime):
+    value = dateutil.parser.parse(value)
+  return _format_datetime(value, format, locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
@@ -154,40 +406,27 @@ def index():
 
 
 @app.route('/venues')
+@page_cache.page('venues', expires=next_show_start)
 def venues():
-  data = []
-  areas = Venue.query.distinct('city','state').all()
-  for area in areas:
-    venues = Venue.query.filter(Venue.city == area.city, Venue.state == area.state).all()
-    venues_by_area = []
-    for v in venues:
-      venues_by_area.append({'id': v.id, 'name': v.name, 'num_upcoming_shows': count_upcoming_shows(v.id)})
-    record = {
-      'city': area.city,
-      'state': area.state,
-      'venues': venues_by_area
-    }
-    data.append(record)
-  return render_template('pages/venues.html', areas=data);
+  return render_template('pages/venues.html', areas=venues_by_area(genre=request.args.get('genre')))
+
+@app.route('/venues/export')
+def export_venues():
+  # streams every venue as newline-delimited JSON
+  return ndjson_response(export_lines(Venue, venue_genre, venue_genre.c.venue_id))
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive. [DONE]
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-  search_term = request.form.get('search_term')
-  venues = Venue.query.filter(Venue.name.ilike('%' + search_term + '%')).all()
-  venues_count = Venue.query.filter(Venue.name.ilike('%' + search_term + '%')).count()
-  data = []
-  for v in venues:
-    data.append({"id": v.id, "name":v.name, "num_upcoming_shows": upcoming_shows(v.id)})
-  response={
-    "count": venues_count ,
-    "data": data
-  }
+  search_term = request.form.get('search_term', '')
+  response = search_by_name(Venue, search_term, limit=request.form.get('limit', SEARCH_RESULTS_LIMIT, type=int),
+                            offset=request.form.get('offset', 0, type=int))
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/venues/<int:venue_id>')
+@page_cache.page('venue', id_arg='venue_id', expires=lambda venue_id: next_show_start(venue_id=venue_id))
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id [DONE]
@@ -195,7 +434,7 @@ def show_venue(venue_id):
   data={
     "id": venue.id,
     "name": venue.name,
-    "genres": venue.genres,
+    "genres": list(venue.genres),
     "address": venue.address,
     "city": venue.city,
     "state": venue.state,
@@ -205,11 +444,8 @@ def show_venue(venue_id):
     "seeking_talent": venue.seeking_talent,
     "seeking_description": venue.seeking_description,
     "image_link": venue.image_link,
-    "past_shows": past_shows(venue.id),
-    "upcoming_shows": upcoming_shows(venue.id),
-    "past_shows_count": count_past_shows(venue.id),
-    "upcoming_shows_count": count_upcoming_shows(venue.id),
   }
+  data.update(show_timeline(venue.id, by='venue'))
   return render_template('pages/show_venue.html', venue=data)
 
 #  Create Venue - [DONE]
@@ -229,7 +465,7 @@ def create_venue_submission():
     state = request.form.get('state')
     address = request.form.get('address')
     phone = request.form.get('phone')
-    genres = request.form.getlist('genres')
+    genres = form_genres()
     facebook_link = request.form.get('facebook_link')
     website = request.form.get('website')
     image_link =request.form.get('image_link')
@@ -250,6 +486,7 @@ def create_venue_submission():
   finally:
     db.session.close()
   if not error:
+    page_cache.invalidate('venues')
     flash('Venue ' + name + ' was successfully listed!', 'info')
   else:
     flash('An error occurred. Venue ' + name + ' could not be listed.')
@@ -271,6 +508,7 @@ def delete_venue(venue_id):
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
   error= False
   try:
+    artist_ids = related_ids(Show.venue_id, Show.artist_id, venue_id)
     Show.query.filter_by(venue_id=venue_id).delete()
     Venue.query.filter_by(id=venue_id).delete()
     db.session.commit()
@@ -281,6 +519,7 @@ def delete_venue(venue_id):
   finally:
     db.session.close()
   if not error:
+    venue_changed(venue_id, artist_ids)
     flash('Venue was deleted!', 'info')
   else:
     flash('An error occurred. Venue could not be deleted.', 'error')
@@ -292,34 +531,37 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@page_cache.page('artists')
 def artists():
   # TODO: replace with real data returned from querying the database [DONE]
   
-  artists = Artist.query.all()
+  query = db.session.query(Artist.id, Artist.name)
+  genre = request.args.get('genre') # e.g. /artists?genre=Jazz
+  if genre is not None:
+    query = query.filter(Artist.genre_rows.any(Genre.name == genre))
   data = []
-  for artist in artists:
-    data.append({"id": artist.id, "name": artist.name})
+  for id, name in query.order_by(Artist.id):
+    data.append({"id": id, "name": name})
 
   return render_template('pages/artists.html', artists=data)
 
+@app.route('/artists/export')
+def export_artists():
+  # streams every artist as newline-delimited JSON
+  return ndjson_response(export_lines(Artist, artist_genre, artist_genre.c.artist_id))
+
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive. [DONE]
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
-  search_term = request.form.get('search_term')
-  artists = Artist.query.filter(Artist.name.ilike('%' + search_term + '%')).all()
-  artists_count = Artist.query.filter(Artist.name.ilike('%' + search_term + '%')).count()
-  data = []
-  for a in artists:
-    data.append({"id": a.id, "name": a.name, "num_upcoming_shows": upcoming_shows(a.id)})
-  response={
-    "count": artists_count ,
-    "data": data
-  }
+  search_term = request.form.get('search_term', '')
+  response = search_by_name(Artist, search_term, limit=request.form.get('limit', SEARCH_RESULTS_LIMIT, type=int),
+                            offset=request.form.get('offset', 0, type=int))
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/artists/<int:artist_id>')
+@page_cache.page('artist', id_arg='artist_id', expires=lambda artist_id: next_show_start(artist_id=artist_id))
 def show_artist(artist_id):
   # shows the artists page with the given venue_id
   # TODO: replace with real artists data from the artists table, using artist_id [DONE]
@@ -327,7 +569,7 @@ def show_artist(artist_id):
   data={
     "id": artist.id,
     "name": artist.name,
-    "genres": artist.genres,
+    "genres": list(artist.genres),
     "city": artist.city,
     "state": artist.state,
     "phone": artist.phone,
@@ -336,8 +578,8 @@ def show_artist(artist_id):
     "seeking_venue": artist.seeking_venue,
     "seeking_description": artist.seeking_description,
     "image_link": artist.image_link,
-    "past_shows": past_shows_artist(artist.id)
     }
+  data.update(show_timeline(artist.id, by='artist'))
 
   return render_template('pages/show_artist.html', artist=data)
 
@@ -350,7 +592,7 @@ def edit_artist(artist_id):
   artist = {
   "id": data.id,
   "name": data.name,
-  "genres": data.genres,
+  "genres": list(data.genres),
   "city": data.city,
   "state": data.state,
   "phone": data.phone,
@@ -375,8 +617,9 @@ def edit_artist_submission(artist_id):
     artist.city = request.form.get('city')
     artist.state = request.form.get('state')
     artist.phone = request.form.get('phone')
-    artist.genres = request.form.getlist('genres')
+    artist.genres = form_genres()
     artist.facebook_link = request.form.get('facebook_link')
+    venue_ids = related_ids(Show.artist_id, Show.venue_id, artist_id)
     db.session.commit()
   except:
     error = True
@@ -385,6 +628,7 @@ def edit_artist_submission(artist_id):
   finally:
     db.session.close()
   if not error:
+    artist_changed(artist_id, venue_ids)
     flash('Artist was successfully updated')
   else:
     flash('Artist ' + request.form['name'] + ' did not update!')
@@ -397,7 +641,7 @@ def edit_venue(venue_id):
   venue={
     "id": data.id,
     "name": data.name,
-    "genres": data.genres,
+    "genres": list(data.genres),
     "address": data.address,
     "city": data.city,
     "state": data.state,
@@ -420,7 +664,7 @@ def edit_venue_submission(venue_id):
   try:  
     venue = Venue.query.get(venue_id)
     venue.name = request.form.get('name')
-    venue.genres = request.form.getlist('genres')
+    venue.genres = form_genres()
     venue.address = request.form.get('address')
     venue.city = request.form.get('city')
     venue.state = request.form.get('state')
@@ -430,6 +674,7 @@ def edit_venue_submission(venue_id):
     venue.seeking_talent = request.form.get('seeking_talent')
     venue.seeking_description = request.form.get('seeking_description')
     venue.image_link = request.form.get('image_link')
+    artist_ids = related_ids(Show.venue_id, Show.artist_id, venue_id)
     db.session.commit()
   except:
     error = True
@@ -438,6 +683,7 @@ def edit_venue_submission(venue_id):
   finally:
     db.session.close()
   if not error:
+    venue_changed(venue_id, artist_ids)
     flash('Venue was updated!')
   else:
     flash('Venue ' + request.form['name'] + 'was not updated')
@@ -462,7 +708,7 @@ def create_artist_submission():
     city = request.form.get('city')
     state = request.form.get('state')
     phone = request.form.get('phone')
-    genres = request.form.getlist('genres')
+    genres = form_genres()
     facebook_link = request.form.get('facebook_link')
 
     artist = Artist(name=name, city=city, state=state, phone=phone, genres=genres, facebook_link=facebook_link)
@@ -478,6 +724,7 @@ def create_artist_submission():
   # TODO: on unsuccessful db insert, flash an error instead. [DONE]
   # e.g., flash('An error occurred. Artist ' + data.name + ' could not be listed.')
   if not error:
+    page_cache.invalidate('artists')
     flash('Artist ' + request.form['name'] + ' was successfully listed!')#
   else:
     flash('Error: Artist ' + request.form['name'] + ' was not created', 'error' )
@@ -488,23 +735,30 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@page_cache.page('shows', expires=lambda: next_show_start() if request.args.get('upcoming') == '1' else None)
 def shows():
   # displays list of shows at /shows
   # TODO: replace with real venues data. [DONE]
   #       num_shows should be aggregated based on number of upcoming shows per venue. [NOT CLEAR WHERE TO IMPLEMENT REQUIREMENT]
-  shows = Show.query.all()
-  data = []
-  for show in shows:
-    data.append({
-      "venue_id": show.venue.id, 
-      "venue_name": show.venue.name, 
-      "artist_id": show.artist.id,
-      "artist_name": show.artist.name,
-      "artist_image_link": show.artist.image_link,
-      "start_time": (show.start_time).strftime("%Y-%m-%dT%H:%M:%S") 
-      })
-
-  return render_template('pages/shows.html', shows=data)
+  upcoming_only = request.args.get('upcoming') == '1'
+  after = None
+  if 'after_time' in request.args and 'after_id' in request.args:
+    try:
+      after = (datetime.fromisoformat(request.args['after_time']), int(request.args['after_id']))
+    except ValueError:
+      abort(400)
+  data, next_after = shows_page(after=after, upcoming_only=upcoming_only)
+  next_url = None
+  if next_after is not None:
+    next_url = url_for('shows', after_time=next_after[0].isoformat(), after_id=next_after[1],
+                       upcoming='1' if upcoming_only else None)
+
+  return render_template('pages/shows.html', shows=data, next_url=next_url, upcoming_only=upcoming_only)
+
+@app.route('/shows/export')
+def export_shows():
+  # streams every show as newline-delimited JSON
+  return ndjson_response(export_lines(Show))
 
 @app.route('/shows/create')
 def create_shows():
@@ -531,6 +785,7 @@ def create_show_submission():
   finally:
     db.session.close()
   if not error:
+    show_added(venue_id, artist_id)
     flash('Show was successfully listed!')
   else:
     flash('An error occurred. Show could not be listed.')
@@ -540,6 +795,36 @@ def create_show_submission():
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
   return render_template('pages/home.html')
 
+@app.route('/shows/import', methods=['POST'])
+def import_show_schedule():
+  # bulk loads shows from an uploaded CSV (venue_id,artist_id,start_time header) or JSON-lines file
+  upload = request.files.get('file')
+  if upload is None:
+    abort(400)
+  stream = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+  report = import_shows(db, Venue, Artist, Show, read_rows(stream, format_for(upload.filename)))
+  if report.inserted:
+    for namespace in ('venue', 'artist', 'venues', 'shows'):
+      page_cache.invalidate(namespace)
+  return jsonify(report.to_dict())
+
+
+@app.cli.command('import-shows')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_shows_command(path):
+  '''Bulk loads shows from a CSV or JSON-lines file.'''
+  with open(path, encoding='utf-8', newline='') as stream:
+    report = import_shows(db, Venue, Artist, Show, read_rows(stream, format_for(path)))
+  for error in report.errors:
+    click.echo('line %d: %s' % (error.line, error.error), err=True)
+  click.echo('%d shows imported, %d rejected' % (report.inserted, report.failed))
+
+
+@app.route('/health/db-pool')
+def db_pool_stats():
+  # connection pool counters of this worker process, to size DB_POOL_SIZE / DB_MAX_OVERFLOW
+  return jsonify(pool_metrics.snapshot())
+
 
 @app.errorhandler(404)
 def not_found_error(error):
@@ -0,0 +1,166 @@
+'''
+Fyyur view benchmarks.
+
+Seeds a throwaway SQLite database with synthetic venues, artists and shows,
+then measures how many SQL statements and how much wall time a view costs as
+the catalogue grows. A view that scales well keeps the query count flat.
+
+    python benchmark.py venues --sizes 100 1000 5000
+
+The page cache is switched off so every request renders the view; pass
+--page-cache to measure cached responses instead.
+
+Micro-benchmarks skip the database and time one piece of rendering instead:
+
+    python benchmark.py format_datetime --sizes 10000
+'''
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+from flask import render_template
+from sqlalchemy import event
+
+from app import app, db, Genre, Venue, Artist, Show, format_datetime, page_cache
+from pool import engine_options
+
+PAGE_NAMESPACES = ('venues', 'venue', 'artists', 'artist', 'shows')
+CITIES = [('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX'), ('Seattle', 'WA'),
+          ('Chicago', 'IL'), ('Boston', 'MA'), ('Denver', 'CO'), ('Miami', 'FL')]
+
+
+class QueryCounter(object):
+  '''Counts statements sent to the database while active.'''
+
+  def __init__(self, engine):
+    self.engine = engine
+    self.count = 0
+
+  def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+    self.count += 1
+
+  def __enter__(self):
+    self.count = 0
+    event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+    return self
+
+  def __exit__(self, *exc):
+    event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+def seed(num_venues, shows_per_venue=4):
+  db.drop_all()
+  db.create_all()
+  now = datetime.now()
+  jazz = Genre(name='Jazz')
+  artists = [Artist(name='Artist %d' % i, city='Austin', state='TX', phone='555-0100',
+                    genre_rows=[jazz]) for i in range(max(num_venues // 10, 1))]
+  db.session.add_all(artists)
+  db.session.flush()
+  venues = []
+  for i in range(num_venues):
+    city, state = CITIES[i % len(CITIES)]
+    venues.append(Venue(name='Venue %d' % i, city=city, state=state, address='1 Main St',
+                        phone='555-0101', genre_rows=[jazz]))
+  db.session.add_all(venues)
+  db.session.flush()
+  for venue in venues:
+    for _ in range(shows_per_venue):
+      db.session.add(Show(venue_id=venue.id, artist_id=random.choice(artists).id,
+                          start_time=now + timedelta(days=random.randint(-365, 365))))
+  db.session.commit()
+  # pages rendered from the previous size's rows must not be served for this one
+  for namespace in PAGE_NAMESPACES:
+    page_cache.invalidate(namespace)
+
+
+def measure(path, repeat=5):
+  client = app.test_client()
+  client.get(path)  # warm up templates and the connection pool
+  with QueryCounter(db.engine) as counter:
+    started = time.perf_counter()
+    for _ in range(repeat):
+      response = client.get(path)
+      assert response.status_code == 200, response.status_code
+    elapsed = (time.perf_counter() - started) / repeat
+  return counter.count // repeat, elapsed
+
+
+def legacy_format_datetime(value, format='medium'):
+  '''The filter before datetimes were passed through: parse the string, then let Babel parse the pattern.'''
+  date = dateutil.parser.parse(value)
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format, locale='en')
+
+
+def bench_format_datetime(size, repeat=3):
+  '''Renders a shows page of size rows with the old and the new datetime filter.'''
+  now = datetime.now().replace(second=0, microsecond=0)
+  shows = [{'venue_id': 1, 'venue_name': 'Venue', 'artist_id': 1, 'artist_name': 'Artist',
+            'artist_image_link': '', 'start_time': now + timedelta(hours=random.randint(-24 * 365, 24 * 365))}
+           for _ in range(size)]
+  legacy_shows = [dict(show, start_time=show['start_time'].strftime("%Y-%m-%dT%H:%M:%S")) for show in shows]
+  timings = []
+  with app.test_request_context('/shows'):
+    for filter, rows in ((legacy_format_datetime, legacy_shows), (format_datetime, shows)):
+      app.jinja_env.filters['datetime'] = filter
+      render_template('pages/shows.html', shows=rows[:10])  # compile the template
+      started = time.perf_counter()
+      for _ in range(repeat):
+        render_template('pages/shows.html', shows=rows)
+      timings.append((time.perf_counter() - started) / repeat)
+    app.jinja_env.filters['datetime'] = format_datetime
+  return timings
+
+
+BENCHMARKS = {
+  'venues': '/venues',
+  'shows': '/shows',
+}
+
+MICRO_BENCHMARKS = {
+  'format_datetime': bench_format_datetime,
+}
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('benchmark', choices=sorted(BENCHMARKS) + sorted(MICRO_BENCHMARKS))
+  parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000])
+  parser.add_argument('--page-cache', action='store_true', help='serve pages from the page cache')
+  args = parser.parse_args()
+  page_cache.enabled = args.page_cache
+
+  if args.benchmark in MICRO_BENCHMARKS:
+    print('%10s %12s %12s' % ('rows', 'before ms', 'after ms'))
+    for size in args.sizes:
+      before, after = MICRO_BENCHMARKS[args.benchmark](size)
+      print('%10d %12.2f %12.2f' % (size, before * 1000, after * 1000))
+    return
+
+  handle, path = tempfile.mkstemp(suffix='.db')
+  os.close(handle)
+  app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+  app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+  try:
+    with app.app_context():
+      print('%10s %10s %12s' % ('venues', 'queries', 'ms/request'))
+      for size in args.sizes:
+        seed(size)
+        queries, elapsed = measure(BENCHMARKS[args.benchmark])
+        print('%10d %10d %12.2f' % (size, queries, elapsed * 1000))
+  finally:
+    os.remove(path)
+
+
+if __name__ == '__main__':
+  main()
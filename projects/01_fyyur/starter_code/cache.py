@@ -0,0 +1,121 @@
+'''
+Rendered page cache.
+
+Listing and detail pages are stored as rendered HTML under a key made of the
+page namespace ('venues', 'venue', ...), the entity id and the query string.
+Write handlers invalidate a namespace, or single ids within it, by replacing
+a generation token that is part of the key. Entries under the old token are
+never read again and age out of the LRU.
+
+Pages that split shows into past and upcoming also expire at the start time
+of their next upcoming show, when that show moves to "past". Every entry
+expires after MAX_AGE regardless, which bounds how stale a page can get when
+another process does the writing.
+
+The backend only needs get/set/delete, so the in-process LRUBackend can be
+swapped for a shared store (memcached, redis) without touching the views.
+'''
+
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+
+from flask import request, session
+
+MAX_AGE = 300 # seconds
+MAX_ENTRIES = 2048
+
+
+class LRUBackend(object):
+  '''Process-local store holding the max_entries most recently used keys.'''
+
+  def __init__(self, max_entries=MAX_ENTRIES):
+    self.max_entries = max_entries
+    self._entries = OrderedDict()
+    self._lock = Lock()
+
+  def get(self, key):
+    with self._lock:
+      value = self._entries.get(key)
+      if value is not None:
+        self._entries.move_to_end(key)
+      return value
+
+  def set(self, key, value):
+    with self._lock:
+      self._entries[key] = value
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+
+  def delete(self, key):
+    with self._lock:
+      self._entries.pop(key, None)
+
+
+class PageCache(object):
+  def __init__(self, backend=None, max_age=MAX_AGE):
+    self.backend = backend or LRUBackend()
+    self.max_age = max_age
+    self.enabled = True # False renders every page, e.g. to benchmark the views themselves
+    self.hits = 0
+    self.misses = 0
+
+  def _generation(self, name):
+    token = self.backend.get(name)
+    if token is None:
+      # a fresh token rather than a counter: a generation evicted from the
+      # backend must never come back with a value old entries were stored under
+      token = uuid.uuid4().hex[:8]
+      self.backend.set(name, token)
+    return token
+
+  def key(self, namespace, id=None, variant=''):
+    key = 'page:%s@%s' % (namespace, self._generation('gen:' + namespace))
+    if id is not None:
+      key += ':%s@%s' % (id, self._generation('gen:%s:%s' % (namespace, id)))
+    return key + '?' + variant
+
+  def invalidate(self, namespace, ids=None):
+    '''Drops every page of namespace, or only the pages of the given ids.'''
+    if ids is None:
+      self.backend.delete('gen:' + namespace)
+      return
+    for id in ids:
+      self.backend.delete('gen:%s:%s' % (namespace, id))
+
+  def get_or_render(self, key, render, expires=None):
+    '''Cached body for key, or render() stored until min(expires(), now + max_age).'''
+    now = time.time()
+    entry = self.backend.get(key)
+    if entry is not None and entry[1] > now:
+      self.hits += 1
+      return entry[0]
+    self.misses += 1
+    body = render()
+    if isinstance(body, str):
+      expires_at = now + self.max_age
+      boundary = expires() if expires is not None else None
+      if boundary is not None:
+        expires_at = min(expires_at, boundary.timestamp())
+      self.backend.set(key, (body, expires_at))
+    return body
+
+  def page(self, namespace, id_arg=None, expires=None):
+    '''Caches a GET view's rendered template.
+    expires(**view_args) may return the datetime at which the page goes stale
+    on its own (e.g. the next upcoming show starting). Requests with pending
+    flash messages are rendered fresh, as the flashes are part of the page.'''
+    def decorator(view):
+      @wraps(view)
+      def wrapper(**view_args):
+        if not self.enabled or '_flashes' in session:
+          return view(**view_args)
+        key = self.key(namespace, view_args.get(id_arg) if id_arg else None,
+                       request.query_string.decode('utf-8', 'replace'))
+        return self.get_or_render(key, lambda: view(**view_args),
+                                  expires and (lambda: expires(**view_args)))
+      return wrapper
+    return decorator
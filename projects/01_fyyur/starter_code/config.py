@@ -1,4 +1,5 @@
 import os
+from pool import engine_options
 
 
 SECRET_KEY = os.urandom(32)
@@ -9,7 +10,10 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 DEBUG = True
 
 # Connect to the database
-SQLALCHEMY_DATABASE_URI = 'postgres://diogocruz@localhost:5432/fyyurapp' 
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgres://diogocruz@localhost:5432/fyyurapp')
+
+# Connection pool, see pool.py for the DB_POOL_* variables
+SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
 
 
 
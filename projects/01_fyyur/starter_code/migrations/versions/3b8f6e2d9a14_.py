@@ -0,0 +1,24 @@
+"""(start_time, id) index for the paginated show listing
+
+Revision ID: 3b8f6e2d9a14
+Revises: 5e7a9d13c2f0
+Create Date: 2026-10-18 13:05:17.482106
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8f6e2d9a14'
+down_revision = '5e7a9d13c2f0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_show_start_time_id', 'show', ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_show_start_time_id', table_name='show')
@@ -0,0 +1,35 @@
+"""composite indexes on show foreign keys and start_time
+
+Revision ID: 5e7a9d13c2f0
+Revises: c41d8e2a7b95
+Create Date: 2026-10-18 11:40:52.270913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e7a9d13c2f0'
+down_revision = 'c41d8e2a7b95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # cb0cdfa84e23 created start_time as VARCHAR while the model uses DateTime;
+    # range filters can only use the index once the column is a real timestamp
+    op.alter_column('show', 'start_time',
+               existing_type=sa.String(length=120),
+               type_=sa.DateTime(),
+               postgresql_using='start_time::timestamp without time zone')
+    op.create_index('ix_show_venue_id_start_time', 'show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_show_artist_id_start_time', 'show', ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_show_artist_id_start_time', table_name='show')
+    op.drop_index('ix_show_venue_id_start_time', table_name='show')
+    op.alter_column('show', 'start_time',
+               existing_type=sa.DateTime(),
+               type_=sa.String(length=120))
@@ -0,0 +1,31 @@
+"""trigram indexes for venue and artist name search
+
+Revision ID: 9f3c2b7d41a6
+Revises: 71667f5dbb98
+Create Date: 2026-10-18 10:12:40.118224
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f3c2b7d41a6'
+down_revision = '71667f5dbb98'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # pg_trgm lets ILIKE '%term%' use a GIN index instead of a sequential scan
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_venue_name_trgm', 'venue', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_artist_name_trgm', 'artist', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_artist_name_trgm', table_name='artist')
+    op.drop_index('ix_venue_name_trgm', table_name='venue')
+    # the extension is left installed, other objects may depend on it
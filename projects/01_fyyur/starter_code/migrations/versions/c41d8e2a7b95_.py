@@ -0,0 +1,102 @@
+"""genre table replacing the pickled venue/artist genres columns
+
+Revision ID: c41d8e2a7b95
+Revises: 9f3c2b7d41a6
+Create Date: 2026-10-18 11:02:17.504381
+
+"""
+import pickle
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d8e2a7b95'
+down_revision = '9f3c2b7d41a6'
+branch_labels = None
+depends_on = None
+
+
+def load_genres(value):
+    """Decodes a stored genres value into a list of names.
+
+    The columns were declared PickleType in the models, but artist.genres was
+    created as VARCHAR by e63861459bf2 and never altered, so rows may hold a
+    pickle (bytea), the text rendering of a pickle ('\\x8003...'), a Postgres
+    array literal ('{Jazz,Rock}') or a plain comma separated string.
+    """
+    if value is None:
+        return []
+    if isinstance(value, memoryview):
+        value = value.tobytes()
+    if isinstance(value, str) and value.startswith('\\x'):
+        value = bytes.fromhex(value[2:])
+    if isinstance(value, bytes):
+        value = pickle.loads(value)
+    if isinstance(value, str):
+        value = value.strip('{}').split(',')
+    return [name.strip().strip('"') for name in value if name and name.strip()]
+
+
+def upgrade():
+    op.create_table('genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('venue_genre',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['genre_id'], ['genre.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id', 'genre_id')
+    )
+    op.create_index('ix_venue_genre_genre_id_venue_id', 'venue_genre', ['genre_id', 'venue_id'], unique=False)
+    op.create_table('artist_genre',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['genre_id'], ['genre.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artist_id', 'genre_id')
+    )
+    op.create_index('ix_artist_genre_genre_id_artist_id', 'artist_genre', ['genre_id', 'artist_id'], unique=False)
+
+    bind = op.get_bind()
+    genre_ids = {}
+    for owner in ('venue', 'artist'):
+        links = []
+        for owner_id, value in bind.execute(sa.text('SELECT id, genres FROM {}'.format(owner))).fetchall():
+            for name in set(load_genres(value)):
+                if name not in genre_ids:
+                    genre_ids[name] = bind.execute(
+                        sa.text('INSERT INTO genre (name) VALUES (:name) RETURNING id'), name=name).scalar()
+                links.append({owner + '_id': owner_id, 'genre_id': genre_ids[name]})
+        if links:
+            bind.execute(sa.text('INSERT INTO {0}_genre ({0}_id, genre_id) VALUES (:{0}_id, :genre_id)'.format(owner)), links)
+
+    op.drop_column('venue', 'genres')
+    op.drop_column('artist', 'genres')
+
+
+def downgrade():
+    op.add_column('venue', sa.Column('genres', sa.PickleType(), nullable=True))
+    op.add_column('artist', sa.Column('genres', sa.PickleType(), nullable=True))
+
+    bind = op.get_bind()
+    for owner in ('venue', 'artist'):
+        genres = {}
+        rows = bind.execute(sa.text(
+            'SELECT l.{0}_id, g.name FROM {0}_genre l JOIN genre g ON g.id = l.genre_id ORDER BY g.name'.format(owner)))
+        for owner_id, name in rows:
+            genres.setdefault(owner_id, []).append(name)
+        for owner_id, names in genres.items():
+            bind.execute(sa.text('UPDATE {} SET genres = :genres WHERE id = :id'.format(owner)),
+                         genres=pickle.dumps(names), id=owner_id)
+
+    op.drop_index('ix_artist_genre_genre_id_artist_id', table_name='artist_genre')
+    op.drop_table('artist_genre')
+    op.drop_index('ix_venue_genre_genre_id_venue_id', table_name='venue_genre')
+    op.drop_table('venue_genre')
+    op.drop_table('genre')
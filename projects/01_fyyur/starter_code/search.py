@@ -0,0 +1,74 @@
+'''
+Name search backends.
+
+On PostgreSQL, partial name searches are answered by the pg_trgm GIN indexes
+created in migration 9f3c2b7d41a6: ILIKE '%term%' can use a trigram index, and
+hits are ranked by similarity(). Other databases (SQLite for benchmarks and
+tests) match and rank in SQL as well, see trigram.py; a TrigramIndex kept
+current through mapper events narrows selective terms to the few ids that
+contain them.
+'''
+
+from threading import Lock
+
+from sqlalchemy import event, false, func
+
+from trigram import TrigramIndex, substring_filter, substring_order
+
+# seconds before an in-process index is rebuilt, bounds how long names
+# written by other processes can be missing from search results
+SEARCH_INDEX_TTL = 60
+
+
+class NameSearch(object):
+  '''Applies a ranked partial-name match to a query, picking the backend from
+  the database dialect the first time it is used.'''
+
+  def __init__(self, db, max_age=SEARCH_INDEX_TTL):
+    self.db = db
+    self.max_age = max_age
+    self._use_postgres = None
+    self._indexes = {}
+    self._lock = Lock()
+
+  def watch(self, model, attr='name'):
+    '''Keeps the in-process index for model.attr in sync with ORM writes.
+    Rows removed with bulk query.delete() stay in the index, but the search
+    query re-checks every candidate against the table so they never surface.'''
+    def upsert(mapper, connection, target):
+      index = self._indexes.get(model)
+      if index is not None:
+        index.add(target.id, getattr(target, attr))
+
+    def remove(mapper, connection, target):
+      index = self._indexes.get(model)
+      if index is not None:
+        index.remove(target.id)
+
+    event.listen(model, 'after_insert', upsert)
+    event.listen(model, 'after_update', upsert)
+    event.listen(model, 'after_delete', remove)
+
+  def index_for(self, model, attr='name'):
+    with self._lock:
+      index = self._indexes.get(model)
+      if index is None or index.age() > self.max_age:
+        index = TrigramIndex()
+        for id, text in self.db.session.query(model.id, getattr(model, attr)):
+          index.add(id, text)
+        self._indexes[model] = index
+    return index
+
+  def apply(self, query, model, term, attr='name'):
+    '''Filters query to rows of model whose attr contains term, best match first.'''
+    if self._use_postgres is None:
+      self._use_postgres = self.db.engine.dialect.name == 'postgresql'
+    column = getattr(model, attr)
+    dialect = self.db.engine.dialect.name
+    query = query.filter(substring_filter(column, term, dialect))
+    if self._use_postgres:
+      return query.order_by(func.similarity(column, term).desc(), model.id)
+    ids = self.index_for(model, attr).candidates(term)
+    if ids is not None:
+      query = query.filter(model.id.in_(ids) if ids else false())
+    return query.order_by(*substring_order(column, term, model.id, dialect))
@@ -0,0 +1,181 @@
+'''
+Bulk show import.
+
+Reads show rows (venue_id, artist_id, start_time) from CSV with a header line
+or from JSON lines, and inserts them in chunks. For each chunk, the referenced
+venue and artist ids are checked with one query per table. The valid rows are
+then written with a single COPY on PostgreSQL, or a single executemany on any
+other database, and the chunk is committed. Rows that fail validation are
+reported by line number and never abort the import.
+
+    flask import-shows tour.csv
+    curl -F file=@tour.jsonl http://localhost:5000/shows/import
+'''
+
+import csv
+import io
+import json
+import re
+from collections import namedtuple
+from datetime import datetime
+
+import dateutil.parser
+
+CHUNK_SIZE = 10000
+MAX_REPORTED_ERRORS = 1000
+FIELDS = ('venue_id', 'artist_id', 'start_time')
+DIGITS = re.compile(r'[0-9]+')
+
+RowError = namedtuple('RowError', ['line', 'error'])
+
+
+class ImportReport(object):
+  def __init__(self):
+    self.inserted = 0
+    self.failed = 0
+    self.errors = []
+
+  def reject(self, line, error):
+    self.failed += 1
+    if len(self.errors) < MAX_REPORTED_ERRORS:
+      self.errors.append(RowError(line, error))
+
+  def to_dict(self):
+    return {
+      "inserted": self.inserted,
+      "failed": self.failed,
+      "errors": [error._asdict() for error in self.errors]
+    }
+
+
+def format_for(filename):
+  '''csv or jsonl, picked from the file extension.'''
+  return 'csv' if (filename or '').lower().endswith('.csv') else 'jsonl'
+
+
+def read_rows(stream, format):
+  '''Yields (line number, row dict or error message) for every record of a text stream.'''
+  if format == 'csv':
+    reader = csv.DictReader(stream)
+    for record in reader:
+      yield reader.line_num, record
+    return
+  for line_num, line in enumerate(stream, 1):
+    if not line.strip():
+      continue
+    try:
+      record = json.loads(line)
+    except ValueError:
+      yield line_num, 'invalid JSON'
+      continue
+    yield line_num, record if isinstance(record, dict) else 'expected a JSON object'
+
+
+def parse_start_time(value):
+  if isinstance(value, datetime):
+    return value
+  try:
+    return datetime.fromisoformat(value)
+  except (TypeError, ValueError):
+    # the fast path only takes ISO 8601, fall back to what the show form accepts
+    return dateutil.parser.parse(value)
+
+
+def parse_id(value):
+  '''An id given as an integer or a string of digits; int() alone would turn 1.5 and True into 1.'''
+  if isinstance(value, int) and not isinstance(value, bool):
+    return value
+  if isinstance(value, str) and DIGITS.fullmatch(value.strip()):
+    return int(value)
+  raise ValueError(value)
+
+
+def parse_row(record):
+  '''(venue_id, artist_id, start_time) from a record, raises ValueError with a readable message.'''
+  if not isinstance(record, dict):
+    raise ValueError(record)
+  missing = [field for field in FIELDS if record.get(field) in (None, '')]
+  if missing:
+    raise ValueError('missing ' + ', '.join(missing))
+  try:
+    venue_id, artist_id = parse_id(record['venue_id']), parse_id(record['artist_id'])
+  except ValueError:
+    raise ValueError('venue_id and artist_id must be integers')
+  try:
+    start_time = parse_start_time(record['start_time'])
+  except (TypeError, ValueError, OverflowError):
+    raise ValueError('unreadable start_time %r' % (record['start_time'],))
+  return venue_id, artist_id, start_time
+
+
+def existing_ids(db, model, ids):
+  if not ids:
+    return set()
+  return {id for id, in db.session.query(model.id).filter(model.id.in_(ids))}
+
+
+def copy_rows(db, table, rows):
+  '''Streams rows into table with COPY, inside the session's transaction.'''
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  for venue_id, artist_id, start_time in rows:
+    writer.writerow((venue_id, artist_id, start_time.isoformat()))
+  buffer.seek(0)
+  cursor = db.session.connection().connection.cursor()
+  try:
+    cursor.copy_expert('COPY "%s" (venue_id, artist_id, start_time) FROM STDIN WITH (FORMAT csv)' % table.name,
+                       buffer)
+  finally:
+    cursor.close()
+
+
+def insert_chunk(db, Venue, Artist, Show, chunk, report):
+  '''Validates and inserts one chunk of (line number, row) pairs in its own transaction.'''
+  parsed = []
+  for line_num, record in chunk:
+    try:
+      parsed.append((line_num, parse_row(record)))
+    except ValueError as error:
+      report.reject(line_num, str(error))
+  venue_ids = existing_ids(db, Venue, {row[0] for _, row in parsed})
+  artist_ids = existing_ids(db, Artist, {row[1] for _, row in parsed})
+  accepted = []
+  for line_num, row in parsed:
+    if row[0] not in venue_ids:
+      report.reject(line_num, 'unknown venue_id %d' % row[0])
+    elif row[1] not in artist_ids:
+      report.reject(line_num, 'unknown artist_id %d' % row[1])
+    else:
+      accepted.append((line_num, row))
+  if not accepted:
+    db.session.rollback()
+    return
+  rows = [row for _, row in accepted]
+  try:
+    if db.engine.dialect.name == 'postgresql':
+      copy_rows(db, Show.__table__, rows)
+    else:
+      db.session.execute(Show.__table__.insert(), [dict(zip(FIELDS, row)) for row in rows])
+    db.session.commit()
+  except Exception:
+    # ids were checked above, so this is a concurrent delete or a database
+    # error; report the whole chunk rather than guess which row caused it
+    db.session.rollback()
+    for line_num, _ in accepted:
+      report.reject(line_num, 'chunk could not be inserted')
+    return
+  report.inserted += len(rows)
+
+
+def import_shows(db, Venue, Artist, Show, records, chunk_size=CHUNK_SIZE):
+  '''Imports (line number, record) pairs as produced by read_rows() and returns an ImportReport.'''
+  report = ImportReport()
+  chunk = []
+  for item in records:
+    chunk.append(item)
+    if len(chunk) >= chunk_size:
+      insert_chunk(db, Venue, Artist, Show, chunk, report)
+      chunk = []
+  if chunk:
+    insert_chunk(db, Venue, Artist, Show, chunk, report)
+  return report
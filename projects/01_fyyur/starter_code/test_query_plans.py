@@ -0,0 +1,130 @@
+import os
+import random
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from pool import engine_options
+from app import app, db, Genre, Venue, Artist, Show, venues_by_area, show_timelines, search_by_name, \
+    shows_page, SEARCH_RESULTS_LIMIT
+
+
+class QueryPlanTestCase(unittest.TestCase):
+    """EXPLAINs the queries issued by the show helpers against a seeded database
+    and fails if any of them falls back to a sequential scan of the show table.
+
+    Needs a local Postgres database, by default fyyurapp_test:
+        createdb fyyurapp_test
+        python test_query_plans.py
+    """
+
+    database_name = "fyyurapp_test"
+    database_path = os.environ.get('FYYUR_TEST_DATABASE_URL',
+                                   "postgres://{}/{}".format('localhost:5432', database_name))
+
+    @classmethod
+    def setUpClass(cls):
+        app.config['SQLALCHEMY_DATABASE_URI'] = cls.database_path
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(cls.database_path)
+        cls.context = app.app_context()
+        cls.context.push()
+        db.session.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        db.session.commit()
+        db.drop_all()
+        db.create_all()
+        cls.seed()
+
+    @classmethod
+    def tearDownClass(cls):
+        db.session.remove()
+        db.drop_all()
+        cls.context.pop()
+
+    @classmethod
+    def seed(cls, num_venues=200, num_artists=200, num_shows=20000):
+        now = datetime.now()
+        rock = Genre(name='Rock')
+        venues = [Venue(name='Venue %d' % i, city='City %d' % (i % 20), state='CA', address='1 Main St',
+                        phone='555-0101', genre_rows=[rock]) for i in range(num_venues)]
+        artists = [Artist(name='Artist %d' % i, city='Austin', state='TX', phone='555-0100',
+                          genre_rows=[rock]) for i in range(num_artists)]
+        db.session.add_all(venues + artists)
+        db.session.flush()
+        db.session.execute(Show.__table__.insert(), [{
+            'venue_id': random.choice(venues).id,
+            'artist_id': random.choice(artists).id,
+            'start_time': now + timedelta(hours=random.randint(-24 * 365, 24 * 365))
+            } for _ in range(num_shows)])
+        db.session.commit()
+        db.session.execute('ANALYZE')
+        db.session.commit()
+        cls.venue_id = venues[0].id
+        cls.artist_id = artists[0].id
+
+    def plans_for(self, helper, *args, **kwargs):
+        """Runs helper, then returns the EXPLAIN output of every SELECT it issued."""
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            helper(*args, **kwargs)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+        self.assertTrue(statements)
+
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            # make the planner pick an index whenever a usable one exists, so the
+            # test doesn't depend on table statistics of the seeded data
+            cursor.execute('SET enable_seqscan = off')
+            plans = []
+            for statement, parameters in statements:
+                cursor.execute('EXPLAIN ' + statement, parameters)
+                plans.append('\n'.join(row[0] for row in cursor.fetchall()))
+            return plans
+        finally:
+            connection.rollback()
+            connection.close()
+
+    def assertNoShowSeqScan(self, plans):
+        for plan in plans:
+            self.assertNotIn('Seq Scan on show', plan, plan)
+
+    def test_venue_directory(self):
+        self.assertNoShowSeqScan(self.plans_for(venues_by_area))
+
+    def test_venue_timeline(self):
+        self.assertNoShowSeqScan(self.plans_for(show_timelines, [self.venue_id], by='venue'))
+
+    def test_artist_timeline(self):
+        self.assertNoShowSeqScan(self.plans_for(show_timelines, [self.artist_id], by='artist'))
+
+    def test_search_venues(self):
+        self.assertNoShowSeqScan(self.plans_for(search_by_name, Venue, 'Venue 1'))
+
+    def test_search_artists(self):
+        self.assertNoShowSeqScan(self.plans_for(search_by_name, Artist, 'Artist 1'))
+
+    def test_search_limit_is_capped(self):
+        response = search_by_name(Venue, 'Venue', limit=1000000, offset=-5)
+        self.assertEqual(len(response['data']), SEARCH_RESULTS_LIMIT)
+        self.assertEqual(response['count'], 200)
+
+    def test_show_listing(self):
+        self.assertNoShowSeqScan(self.plans_for(shows_page))
+
+    def test_show_listing_next_page(self):
+        data, next_after = shows_page(upcoming_only=True)
+        self.assertIsNotNone(next_after)
+        self.assertNoShowSeqScan(self.plans_for(shows_page, after=next_after, upcoming_only=True))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+'''
+Substring search for databases without pg_trgm.
+
+Shared by Fyyur and the trivia API. projects/shared/trigram.py is the original;
+each app deploys on its own and carries a byte-identical copy, kept in sync by
+projects/shared/vendor.py. Edit the original, then run python vendor.py from
+projects/shared.
+
+On PostgreSQL with pg_trgm the apps filter with ILIKE '%term%', served by a GIN
+trigram index, and rank by similarity. Everywhere else the same search stays in
+SQL too:
+
+    substring_filter()  ILIKE '%term%', with % and _ in the term taken literally
+    substring_order()   prefix matches first, then shorter texts, then id
+
+so a broad term ("Qu", or an empty one) is still one query whose size is set by
+the caller's LIMIT/OFFSET, never by the number of matches.
+
+TrigramIndex is an in-process inverted index over the same trigrams. When a term
+is selective it hands back the few ids that contain it (at most CANDIDATES_MAX),
+which the caller adds as id IN (...) so the database checks those rows instead of
+scanning the table. It only sees writes made through this process, so callers
+rebuild it once it is older than their TTL.
+'''
+
+import time
+from collections import defaultdict
+from threading import Lock
+
+from sqlalchemy import case, func
+
+# ids one search may send as bound parameters, well below SQLite's limit of 999
+CANDIDATES_MAX = 500
+
+
+def trigrams(text):
+    '''Every 3-character window of the lowercased text.'''
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _like(column, pattern, dialect):
+    # SQLite's LIKE already ignores ASCII case; its ILIKE would wrap both sides in lower()
+    if dialect == 'sqlite':
+        return column.like(pattern, escape='\\')
+    return column.ilike(pattern, escape='\\')
+
+
+def substring_filter(column, term, dialect):
+    '''column contains term, case-insensitively; dialect is the engine's dialect name.'''
+    return _like(column, '%' + _escape_like(term) + '%', dialect)
+
+
+def substring_order(column, term, id_column, dialect):
+    '''ORDER BY clauses ranking substring matches: prefix matches, then shorter texts, then id.'''
+    starts_with = _like(column, _escape_like(term) + '%', dialect)
+    return case([(starts_with, 0)], else_=1), func.length(column), id_column
+
+
+class TrigramIndex(object):
+    '''Maps trigram -> ids so a selective substring search only checks candidate rows.'''
+
+    def __init__(self):
+        self._texts = {}
+        self._postings = defaultdict(set)
+        self._lock = Lock()
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._texts)
+
+    def age(self):
+        '''Seconds since the index was created.'''
+        return time.monotonic() - self.built_at
+
+    def add(self, id, text):
+        with self._lock:
+            self._discard(id)
+            text = (text or '').lower()
+            self._texts[id] = text
+            for gram in trigrams(text):
+                self._postings[gram].add(id)
+
+    def remove(self, id):
+        with self._lock:
+            self._discard(id)
+
+    def _discard(self, id):
+        text = self._texts.pop(id, None)
+        if text is None:
+            return
+        for gram in trigrams(text):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(id)
+                if not ids:
+                    del self._postings[gram]
+
+    def candidates(self, term, limit=CANDIDATES_MAX):
+        '''Ids whose text contains term (case-insensitive), or None when the index
+        can't narrow the search to at most limit rows: terms under 3 characters,
+        or terms whose rarest trigram is in more than limit rows.'''
+        grams = trigrams(term)
+        if not grams:
+            return None
+        term = term.lower()
+        with self._lock:
+            postings = sorted((self._postings.get(gram, ()) for gram in grams), key=len)
+            if len(postings[0]) > limit:
+                return None
+            ids = set(postings[0]).intersection(*postings[1:])
+            return sorted(id for id in ids if term in self._texts[id])
@@ -1,18 +1,29 @@
 import os
 from flask import Flask, request, abort, jsonify, flash
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func
 from flask_cors import CORS
 import random
 import json
 
-from models import setup_db, Question, Category
+from models import setup_db, database_path, Question, question_search, question_count, \
+  category_question_count, category_types
+from .quiz import QuizEngine, QuizSession, InMemorySessionStore
+from pool import pool_metrics
+from metrics import RequestMetrics
 
 QUESTIONS_PER_PAGE = 10
+SEARCH_RESULTS_LIMIT = 100 # max questions returned per search request
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
-  setup_db(app)
+  if test_config is not None:
+    app.config.update(test_config)
+  setup_db(app, app.config.get('SQLALCHEMY_DATABASE_URI', database_path))
+  RequestMetrics(app, namespace='trivia') # Server-Timing headers and GET /metrics
+  quiz_engine = QuizEngine()
+  quiz_sessions = InMemorySessionStore()
   
   '''
   [DONE]
@@ -40,10 +51,9 @@ def create_app(test_config=None):
   @app.route('/categories')
   def get_categories():  
     try:
-      categories = Category.query.all() # query for all categories in the db
-      result = {cat.id:cat.type for cat in categories} # hat tip to student in https://knowledge.udacity.com/questions/82388 whose question helped me here
+      result = category_types() # {id: type}, cached in models.py
 
-      if len(categories) == 0: 
+      if len(result) == 0: 
         abort(404) # Not found
 
       return jsonify({
@@ -75,17 +85,19 @@ def create_app(test_config=None):
     try:
 
       page = request.args.get('page', 1, type=int) #if the client does not include the argument for page, the value will default to 1.
-      start = (page - 1) * QUESTIONS_PER_PAGE
-      end = start + QUESTIONS_PER_PAGE # gives me start and end index to use when slicing the questions list
-
-      questions = Question.query.all()
-      formated_questions = [question.format() for question in questions]
-      page_questions = formated_questions[start:end]
-      categories = Category.query.all()
-       
+      after_id = request.args.get('after_id', None, type=int) # keyset cursor: id of the last question already shown
+
+      '''Only one page of rows is read from the database. With after_id the page is found through the
+      primary key index, so deep pages cost the same as the first one; otherwise fall back to OFFSET.'''
+      query = Question.query.order_by(Question.id)
+      if after_id is not None:
+        query = query.filter(Question.id > after_id)
+      else:
+        query = query.offset((page - 1) * QUESTIONS_PER_PAGE)
+      page_questions = [question.format() for question in query.limit(QUESTIONS_PER_PAGE).all()]
       '''I choose to show all categories available even if there are no questions in the category.
       An alternative approach would be to show only the categories for which I have questions'''
-      formated_categories = [category.type for category in categories] 
+      formated_categories = list(category_types().values())
 
       '''current category given by the query string'''
       current_category = request.args.get('category', None, type=int)
@@ -97,9 +109,10 @@ def create_app(test_config=None):
       return jsonify({
         'success': True,
         'questions': page_questions,
-        'total_questions': len(formated_questions),
+        'total_questions': question_count(),
         'current_category': current_category,
-        'categories': formated_categories
+        'categories': formated_categories,
+        'next_after_id': page_questions[-1]['id'] if len(page_questions) == QUESTIONS_PER_PAGE else None
         })
 
     except:
@@ -187,9 +200,19 @@ def create_app(test_config=None):
     body = request.get_json()
     search = body.get('searchTerm')
     try:
-      results = Question.query.filter(Question.question.ilike('%' + search + '%')).all()
-      formated_result = [result.format() for result in results]
-      count = Question.query.filter(Question.question.ilike('%' + search + '%')).count()
+      '''At most SEARCH_RESULTS_LIMIT matches are read per request, page with 'offset'. The
+      matches and their total (COUNT(*) OVER ()) come back from one query.'''
+      limit = min(max(int(body.get('limit', SEARCH_RESULTS_LIMIT)), 1), SEARCH_RESULTS_LIMIT)
+      offset = max(int(body.get('offset', 0)), 0)
+      rows = question_search.apply(Question.query.add_columns(func.count().over()), search) \
+        .limit(limit).offset(offset).all()
+      formated_result = [question.format() for question, _ in rows]
+      if rows:
+        count = rows[0][1]
+      elif offset:
+        count = question_search.apply(Question.query, search).count() # paged past the end
+      else:
+        count = 0
       current_category = None
 
       return jsonify({
@@ -214,14 +237,24 @@ def create_app(test_config=None):
   @app.route('/categories/<int:category_id>/questions')
   def questions_by_category(category_id):
     try:
-      questions_by_cat = Question.query.filter(Question.category == category_id).all()
-      formated_questions = [question.format() for question in questions_by_cat]
+      page = request.args.get('page', 1, type=int)
+      after_id = request.args.get('after_id', None, type=int)
+
+      '''Same pagination as GET /questions: one page of the category read in id order, with
+      after_id seeking straight to it. The total comes from the cached per-category counts.'''
+      query = Question.query.filter(Question.category == category_id).order_by(Question.id)
+      if after_id is not None:
+        query = query.filter(Question.id > after_id)
+      else:
+        query = query.offset((page - 1) * QUESTIONS_PER_PAGE)
+      formated_questions = [question.format() for question in query.limit(QUESTIONS_PER_PAGE).all()]
 
       return jsonify({
         'success': True,
         'questions': formated_questions,
-        'total_questions': len(formated_questions),
-        'currentCategory': category_id
+        'total_questions': category_question_count(category_id),
+        'currentCategory': category_id,
+        'next_after_id': formated_questions[-1]['id'] if len(formated_questions) == QUESTIONS_PER_PAGE else None
         })
     except:
       abort(422)
@@ -241,22 +274,23 @@ def create_app(test_config=None):
   '''
   @app.route('/quizzes', methods=['POST'])
   def quizz():
-    body = request.get_json()
-    previous_questions = body.get('previous_questions') # gives me a list with previous questions
-    category = body.get('quiz_category')
+    body = request.get_json() or {}
+    if not isinstance(body, dict):
+      abort(422)
+    previous_questions = body.get('previous_questions') or [] # gives me a list with previous questions
+    category = body.get('quiz_category') or {}
+    if not isinstance(previous_questions, list) or not isinstance(category, dict):
+      abort(422)
+    try:
+      category_id = int(category.get('id', 0)) # 0 when user chooses to play all categories
+      seen = frozenset(int(id) for id in previous_questions) # clients may send ids as strings
+    except (TypeError, ValueError):
+      abort(422)
 
-    if category.get('id') == 0: # when user chooses to play all categories
-      current_question = Question.query.filter(~Question.id.in_(previous_questions)).first()
-      if current_question:
-        formated_question = current_question.format()
-      else:
-        abort(404) # no more questions available
-    else:
-      current_question = Question.query.filter(Question.category == category.get('id'), ~Question.id.in_(previous_questions)).first()
-      if current_question:
-        formated_question = current_question.format()
-      else:
-        abort(404)
+    current_question = quiz_engine.next_question(category_id, seen)
+    if current_question is None:
+      abort(404) # no more questions available
+    formated_question = current_question.format()
 
     return jsonify({
       'success': True,
@@ -266,6 +300,66 @@ def create_app(test_config=None):
 
 
 
+  '''
+  Server-side quiz sessions: an alternative to POST /quizzes where the server remembers
+  the questions already asked, so every round is a fixed-size request instead of
+  re-sending the whole previous_questions list.
+  '''
+  @app.route('/quizzes/sessions', methods=['POST'])
+  def start_quiz_session():
+    body = request.get_json() or {}
+    if not isinstance(body, dict):
+      abort(422)
+    category = body.get('quiz_category') or {}
+    if not isinstance(category, dict):
+      abort(422)
+    try:
+      category_id = int(category.get('id', 0))
+    except (TypeError, ValueError):
+      abort(422)
+
+    session = QuizSession(category_id)
+    quiz_sessions.save(session)
+
+    return jsonify({
+      'success': True,
+      'session_id': session.id
+      })
+
+  @app.route('/quizzes/sessions/<session_id>', methods=['POST'])
+  def next_session_question(session_id):
+    session = quiz_sessions.get(session_id)
+    if session is None:
+      abort(404) # unknown or expired session
+
+    current_question = quiz_engine.next_question(session.category_id, session.seen)
+    if current_question is None:
+      abort(404) # no more questions available
+    quiz_sessions.mark_seen(session, current_question.id)
+
+    return jsonify({
+      'success': True,
+      'session_id': session.id,
+      'question': current_question.format()
+      })
+
+  @app.route('/quizzes/sessions/<session_id>', methods=['DELETE'])
+  def end_quiz_session(session_id):
+    quiz_sessions.delete(session_id)
+    return jsonify({
+      'success': True,
+      'deleted': session_id
+      })
+
+  @app.route('/health/db-pool')
+  def db_pool_stats():
+    # connection pool counters of this worker process, see pool.py
+    return jsonify({
+      'success': True,
+      'pool': pool_metrics.snapshot()
+      })
+
+
   '''
   [DONE]
   @TODO: 
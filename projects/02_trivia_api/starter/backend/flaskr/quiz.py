@@ -0,0 +1,144 @@
+import random
+import secrets
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from models import db, Question, questions_generation
+
+DECK_TTL = 300 # seconds, bounds staleness caused by writes from other processes
+RANDOM_PROBES = 8
+SESSION_TTL = 60 * 60 # seconds a quiz session may sit idle
+MAX_SESSIONS = 10000
+
+
+class QuizEngine(object):
+  '''Draws random, not yet seen questions for the quiz.
+
+  The ids of the questions in each category (0 = all categories) are loaded
+  once and kept in memory. The deck is rebuilt when a question is inserted,
+  updated or deleted in this process, or after DECK_TTL.
+
+  A draw probes RANDOM_PROBES random positions of the deck, which almost always
+  finds an unseen question while less than about half of the deck has been
+  seen. Past that, it picks among the unseen ids with one pass over the deck, so
+  a draw late in a long game costs O(deck size) instead of a database query.
+  '''
+
+  def __init__(self, rng=None):
+    self._random = rng or random.Random()
+    self._decks = {}
+    self._lock = Lock()
+
+  def deck(self, category_id):
+    generation = questions_generation()
+    now = time.monotonic()
+    with self._lock:
+      cached = self._decks.get(category_id)
+      if cached is not None and cached[0] == generation and now - cached[1] < DECK_TTL:
+        return cached[2]
+    query = db.session.query(Question.id)
+    if category_id:
+      query = query.filter(Question.category == category_id)
+    ids = [id for id, in query]
+    with self._lock:
+      self._decks[category_id] = (generation, now, ids)
+    return ids
+
+  def invalidate(self, category_id=None):
+    with self._lock:
+      if category_id is None:
+        self._decks.clear()
+      else:
+        self._decks.pop(category_id, None)
+
+  def draw(self, category_id, seen):
+    '''Id of a random question of the category that is not in seen, or None when all were seen.'''
+    ids = self.deck(category_id)
+    if not ids:
+      return None
+    for _ in range(RANDOM_PROBES):
+      id = ids[self._random.randrange(len(ids))]
+      if id not in seen:
+        return id
+    unseen = [id for id in ids if id not in seen]
+    return self._random.choice(unseen) if unseen else None
+
+  def next_question(self, category_id, seen):
+    '''Random unseen Question of the category, or None when the category is exhausted.'''
+    id = self.draw(category_id, seen)
+    if id is None:
+      return None
+    question = Question.query.get(id)
+    if question is None:
+      # deleted by another process since the deck was built
+      self.invalidate(category_id)
+      id = self.draw(category_id, seen)
+      question = Question.query.get(id) if id is not None else None
+    return question
+
+
+class QuizSession(object):
+  __slots__ = ('id', 'category_id', 'seen', 'expires_at')
+
+  def __init__(self, category_id):
+    self.id = secrets.token_urlsafe(16)
+    self.category_id = category_id
+    self.seen = set() # ids of the questions already asked, grows with the game, not with the ids
+    self.expires_at = None
+
+
+class InMemorySessionStore(object):
+  '''LRU store for quiz sessions with idle expiry.
+
+  A replacement store (e.g. one shared between workers) only needs the same
+  get/save/mark_seen/delete methods.
+  '''
+
+  def __init__(self, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+    self.ttl = ttl
+    self.max_sessions = max_sessions
+    self._sessions = OrderedDict()
+    self._lock = Lock()
+
+  def get(self, session_id):
+    now = time.monotonic()
+    with self._lock:
+      session = self._sessions.get(session_id)
+      if session is None:
+        return None
+      if session.expires_at <= now:
+        del self._sessions[session_id]
+        return None
+      session.expires_at = now + self.ttl
+      self._sessions.move_to_end(session_id)
+      return session
+
+  def save(self, session):
+    with self._lock:
+      self._save(session)
+
+  def mark_seen(self, session, question_id):
+    '''Records question_id as asked under the store lock, so concurrent rounds of one session don't race.'''
+    with self._lock:
+      session.seen.add(question_id)
+      self._save(session)
+
+  def _save(self, session):
+    now = time.monotonic()
+    session.expires_at = now + self.ttl
+    self._sessions[session.id] = session
+    self._sessions.move_to_end(session.id)
+    # least recently used sessions sit at the front
+    while self._sessions:
+      oldest = next(iter(self._sessions.values()))
+      if len(self._sessions) <= self.max_sessions and oldest.expires_at > now:
+        break
+      self._sessions.popitem(last=False)
+
+  def delete(self, session_id):
+    with self._lock:
+      self._sessions.pop(session_id, None)
+
+  def __len__(self):
+    return len(self._sessions)
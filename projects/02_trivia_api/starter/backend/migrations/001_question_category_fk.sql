@@ -0,0 +1,47 @@
+--
+-- questions.category: integer foreign key to categories.id, indexed with (category, id)
+--
+--   psql trivia < migrations/001_question_category_fk.sql
+--
+-- Databases created by db.create_all() before this change have a VARCHAR category
+-- holding ids as text ('1'); rows may also carry a category name ('Science').
+-- Both are converted to the category id, anything else becomes NULL - the same
+-- as a question whose category was deleted. Databases restored from trivia.psql
+-- already have the integer column and foreign key and only gain the index.
+-- Safe to run more than once.
+--
+
+BEGIN;
+
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'questions' AND column_name = 'category') <> 'integer' THEN
+
+        UPDATE questions SET category = categories.id::text
+        FROM categories
+        WHERE trim(questions.category) !~ '^[0-9]+$'
+          AND lower(trim(questions.category)) = lower(trim(categories.type));
+
+        UPDATE questions SET category = NULL
+        WHERE category IS NOT NULL
+          AND NOT CASE WHEN trim(category) ~ '^[0-9]{1,9}$'
+                       THEN trim(category)::integer IN (SELECT id FROM categories)
+                       ELSE false END;
+
+        ALTER TABLE questions ALTER COLUMN category TYPE integer USING trim(category)::integer;
+    END IF;
+
+    -- named "category" like the constraint in trivia.psql
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint
+                   WHERE conrelid = 'questions'::regclass AND contype = 'f') THEN
+        ALTER TABLE questions ADD CONSTRAINT category FOREIGN KEY (category)
+            REFERENCES categories(id) ON UPDATE CASCADE ON DELETE SET NULL;
+    END IF;
+END
+$$;
+
+-- also covers plain category lookups, e.g. the ON DELETE SET NULL of a category
+CREATE INDEX IF NOT EXISTS ix_questions_category_id ON questions (category, id);
+
+COMMIT;
@@ -0,0 +1,14 @@
+--
+-- pg_trgm GIN index on questions.question for POST /questions/search
+--
+--   psql trivia < migrations/002_question_search_trgm.sql
+--
+-- CREATE EXTENSION needs a role allowed to create extensions (usually the
+-- database owner or a superuser), which is why the app does not run this on
+-- startup. Without pg_trgm the app still searches, using the in-process
+-- trigram index in search.py. Safe to run more than once.
+--
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS ix_questions_question_trgm ON questions USING gin (question gin_trgm_ops);
@@ -1,8 +1,13 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import time
+from threading import Lock
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, create_engine, event, func, inspect
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from search import TextSearch
+from pool import engine_options
+
 database_name = "trivia"
 database_path = "postgres://{}/{}".format('localhost:5432', database_name)
 
@@ -15,39 +20,109 @@ setup_db(app)
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
     db.app = app
     db.init_app(app)
     db.create_all()
 
 '''
-Question
+Question cache bookkeeping
+    every Question write bumps the generation, so data cached in this process
+    (e.g. quiz decks) knows it is stale without asking the database.
+'''
+_questions = {'generation': 0}
+
+def questions_changed():
+    _questions['generation'] += 1
 
+def questions_generation():
+    return _questions['generation']
+
+'''
+Question counts
+    the total and per-category number of questions, read with one GROUP BY query and then
+    kept current in place by Question.insert/update/delete instead of being recounted.
+    COUNT_CACHE_TTL bounds how long writes made by other processes can go unnoticed.
+'''
+COUNT_CACHE_TTL = 30 # seconds
+
+_counts = {'total': None, 'by_category': None, 'computed_at': None}
+_counts_lock = Lock()
+
+def question_counts():
+    '''(total, {category id: count}), served from memory until the TTL runs out'''
+    with _counts_lock:
+        if _counts['computed_at'] is not None and time.monotonic() - _counts['computed_at'] < COUNT_CACHE_TTL:
+            return _counts['total'], dict(_counts['by_category'])
+    by_category = dict(db.session.query(Question.category, func.count(Question.id)).group_by(Question.category))
+    total = sum(by_category.values())
+    with _counts_lock:
+        _counts.update(total=total, by_category=by_category, computed_at=time.monotonic())
+    return total, dict(by_category)
+
+def question_count():
+    return question_counts()[0]
+
+def category_question_count(category_id):
+    return question_counts()[1].get(category_id, 0)
+
+def adjust_question_counts(category, delta):
+    '''applies one insert (+1) or delete (-1) to the cached counts, if any are cached'''
+    with _counts_lock:
+        if _counts['computed_at'] is None:
+            return
+        _counts['total'] += delta
+        _counts['by_category'][category] = _counts['by_category'].get(category, 0) + delta
+
+def reset_question_counts():
+    with _counts_lock:
+        _counts.update(total=None, by_category=None, computed_at=None)
+
+'''
+Question
+    category is an integer foreign key to categories.id, named "category" like in trivia.psql.
+    ix_questions_category_id serves both the category listing (WHERE category = ? ORDER BY id)
+    and the quiz decks (ids of a category) straight from the index.
+    Databases created before it was an integer are converted by migrations/001_question_category_fk.sql.
 '''
 class Question(db.Model):  
   __tablename__ = 'questions'
+  __table_args__ = (Index('ix_questions_category_id', 'category', 'id'),)
 
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(Integer, ForeignKey('categories.id', name='category', onupdate='CASCADE', ondelete='SET NULL'))
   difficulty = Column(Integer)
 
   def __init__(self, question, answer, category, difficulty):
     self.question = question
     self.answer = answer
-    self.category = category
+    self.category = None if category is None else int(category) # the add form posts '1'
     self.difficulty = difficulty
 
   def insert(self):
+    category = self.category
     db.session.add(self)
     db.session.commit()
+    questions_changed()
+    adjust_question_counts(category, +1)
   
   def update(self):
+    old_categories = inspect(self).attrs.category.history.deleted
+    category = self.category
     db.session.commit()
+    questions_changed()
+    for old_category in old_categories:
+      adjust_question_counts(old_category, -1)
+      adjust_question_counts(category, +1)
 
   def delete(self):
+    category = self.category
     db.session.delete(self)
     db.session.commit()
+    questions_changed()
+    adjust_question_counts(category, -1)
 
   def format(self):
     return {
@@ -58,6 +133,8 @@ class Question(db.Model):
       'difficulty': self.difficulty
     }
 
+question_search = TextSearch(db, Question, 'question')
+
 '''
 Category
 
@@ -75,4 +152,29 @@ class Category(db.Model):
     return {
       'id': self.id,
       'type': self.type
-    }
\ No newline at end of file
+    }
+
+'''
+Category cache
+    categories are a small, practically static table: {id: type} is read once and
+    served from memory, and dropped whenever a Category is written through the ORM.
+    CATEGORY_CACHE_TTL bounds how long changes made elsewhere (e.g. psql) go unnoticed.
+'''
+CATEGORY_CACHE_TTL = 300 # seconds
+
+_categories = {'types': None, 'loaded_at': None}
+
+def category_types():
+    '''{id: type} of every category, in id order'''
+    types, loaded_at = _categories['types'], _categories['loaded_at']
+    if types is not None and time.monotonic() - loaded_at < CATEGORY_CACHE_TTL:
+        return types
+    types = {id: type for id, type in db.session.query(Category.id, Category.type).order_by(Category.id)}
+    _categories.update(types=types, loaded_at=time.monotonic())
+    return types
+
+def categories_changed(*args):
+    _categories.update(types=None, loaded_at=None)
+
+for _event in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Category, _event, categories_changed)
@@ -0,0 +1,158 @@
+'''
+Database connection pool settings and metrics.
+
+Shared by Fyyur, the trivia API and the coffee shop. projects/shared/pool.py is
+the original; each app deploys on its own and carries a byte-identical copy,
+kept in sync by projects/shared/vendor.py. Edit the original, then run
+python vendor.py from projects/shared.
+
+engine_options() builds SQLALCHEMY_ENGINE_OPTIONS from environment variables:
+
+    DB_POOL_SIZE            connections kept open per process (5)
+    DB_MAX_OVERFLOW         extra connections opened under load (10)
+    DB_POOL_TIMEOUT         seconds a request waits for a free connection (30)
+    DB_POOL_RECYCLE         seconds before a connection is replaced (1800)
+    DB_POOL_PRE_PING        test connections on checkout, 0 to disable (1)
+    DB_STATEMENT_TIMEOUT    PostgreSQL statement_timeout in ms, 0 for none (0)
+
+SQLite keeps SQLAlchemy's own pool and only gets pre-ping. Size the pool per
+gunicorn worker: workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) must stay below the
+server's max_connections.
+
+pool_metrics backs the apps' GET /health/db-pool. Checkouts, new connections
+and invalidations of every pool come from pool events. InstrumentedQueuePool
+adds checkout wait time and overflow use; those only cover the checkouts it
+timed (waits), so the average wait is taken over waits, not over checkouts.
+'''
+
+import os
+import time
+import weakref
+from threading import Lock
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import Pool, QueuePool
+
+
+def _env(name, default, cast=int):
+    value = os.environ.get(name)
+    return default if value in (None, '') else cast(value)
+
+
+def engine_options(database_uri):
+    '''create_engine() options for database_uri; SQLite keeps SQLAlchemy's own pool.'''
+    options = {'pool_pre_ping': bool(_env('DB_POOL_PRE_PING', 1))}
+    if database_uri.startswith('sqlite'):
+        return options
+    options.update({
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': _env('DB_POOL_SIZE', 5),
+        'max_overflow': _env('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': _env('DB_POOL_TIMEOUT', 30, float),
+        'pool_recycle': _env('DB_POOL_RECYCLE', 1800),
+    })
+    statement_timeout = _env('DB_STATEMENT_TIMEOUT', 0)
+    if statement_timeout and database_uri.startswith('postgres'):
+        options['connect_args'] = {'options': '-c statement_timeout=%d' % statement_timeout}
+    return options
+
+
+class PoolMetrics:
+    '''Process-wide pool counters.'''
+
+    def __init__(self):
+        self._lock = Lock()
+        self._pools = weakref.WeakSet()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkins = 0
+            self.connects = 0
+            self.invalidations = 0
+            self.timeouts = 0
+            self.waits = 0
+            self.wait_seconds_total = 0.0
+            self.wait_seconds_max = 0.0
+            self.overflow_peak = 0
+
+    def track(self, pool):
+        self._pools.add(pool)
+
+    def record_wait(self, seconds, overflow, timed_out=False):
+        with self._lock:
+            self.waits += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            self.overflow_peak = max(self.overflow_peak, overflow)
+            if timed_out:
+                self.timeouts += 1
+
+    def incr(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            data = {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "waits": self.waits,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+                "wait_seconds_avg": round(self.wait_seconds_total / self.waits, 6) if self.waits else 0.0,
+                "overflow_peak": self.overflow_peak,
+            }
+        data["pools"] = [{
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": pool._max_overflow,
+        } for pool in list(self._pools)]
+        return data
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    '''QueuePool that reports how long each checkout waited for a connection.'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        pool_metrics.track(self)
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.record_wait(time.perf_counter() - started, max(self.overflow(), 0), timed_out=True)
+            raise
+        pool_metrics.record_wait(time.perf_counter() - started, max(self.overflow(), 0))
+        return connection
+
+
+@event.listens_for(Pool, 'checkout')
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_metrics.incr('checkouts')
+
+
+@event.listens_for(Pool, 'checkin')
+def _on_checkin(dbapi_connection, connection_record):
+    pool_metrics.incr('checkins')
+
+
+@event.listens_for(Pool, 'connect')
+def _on_connect(dbapi_connection, connection_record):
+    pool_metrics.incr('connects')
+
+
+@event.listens_for(Pool, 'invalidate')
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    pool_metrics.incr('invalidations')
@@ -0,0 +1,79 @@
+'''
+Substring search over question text.
+
+On PostgreSQL with the pg_trgm extension installed (migrations/002_question_search_trgm.sql
+also creates a GIN index on questions.question), ILIKE '%term%' is served from
+the index and results are ranked with word_similarity(). Everywhere else
+(SQLite test runs, or a database where the extension could not be created) the
+match and the ranking are still done in SQL, see trigram.py; a TrigramIndex
+maintained from Question insert/update/delete events narrows selective terms
+to the few ids that contain them.
+'''
+
+from threading import Lock
+
+from sqlalchemy import event, false, func
+
+from trigram import TrigramIndex, substring_filter, substring_order
+
+# seconds before the in-process index is rebuilt, bounds how long questions
+# written by other processes can be missing from search results
+SEARCH_INDEX_TTL = 60
+
+
+class TextSearch(object):
+  '''Ranked substring filter for one text column of one model.'''
+
+  def __init__(self, db, model, attr, max_age=SEARCH_INDEX_TTL):
+    self.db = db
+    self.model = model
+    self.column = getattr(model, attr)
+    self.max_age = max_age
+    self._index = None
+    self._use_postgres = None
+    self._lock = Lock()
+    event.listen(model, 'after_insert', self._upsert)
+    event.listen(model, 'after_update', self._upsert)
+    event.listen(model, 'after_delete', self._remove)
+
+  def _upsert(self, mapper, connection, target):
+    if self._index is not None:
+      self._index.add(target.id, getattr(target, self.column.key))
+
+  def _remove(self, mapper, connection, target):
+    if self._index is not None:
+      self._index.remove(target.id)
+
+  def reset(self):
+    '''Forgets the index and the detected backend, e.g. after pointing db at another database.'''
+    with self._lock:
+      self._index = None
+      self._use_postgres = None
+
+  def has_pg_trgm(self):
+    '''word_similarity() only exists once pg_trgm is installed in the database'''
+    if self.db.engine.dialect.name != 'postgresql':
+      return False
+    return self.db.session.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'").first() is not None
+
+  def index(self):
+    with self._lock:
+      if self._index is None or self._index.age() > self.max_age:
+        index = TrigramIndex()
+        for id, text in self.db.session.query(self.model.id, self.column):
+          index.add(id, text)
+        self._index = index
+    return self._index
+
+  def apply(self, query, term):
+    '''Restricts query to rows containing term (case-insensitive), best match first.'''
+    if self._use_postgres is None:
+      self._use_postgres = self.has_pg_trgm()
+    dialect = self.db.engine.dialect.name
+    query = query.filter(substring_filter(self.column, term, dialect))
+    if self._use_postgres:
+      return query.order_by(func.word_similarity(term, self.column).desc(), self.model.id)
+    ids = self.index().candidates(term)
+    if ids is not None:
+      query = query.filter(self.model.id.in_(ids) if ids else false())
+    return query.order_by(*substring_order(self.column, term, self.model.id, dialect))
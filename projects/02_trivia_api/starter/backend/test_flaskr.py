@@ -1,10 +1,15 @@
 import os
 import unittest
 import json
+import math
+import random
+import tempfile
+import time
+import tracemalloc
 from flask_sqlalchemy import SQLAlchemy
 
-from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr import create_app, SEARCH_RESULTS_LIMIT
+from models import setup_db, db, Question, Category, question_search, reset_question_counts, categories_changed
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -63,6 +68,17 @@ class TriviaTestCase(unittest.TestCase):
         self.assertIsNone(data['current_category'])
         self.assertTrue(data['categories'])
 
+    def test_get_questions_after_id(self):
+        first_page = json.loads(self.client().get('/questions').data)
+        res = self.client().get('/questions?after_id={}'.format(first_page['next_after_id']))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['questions'])
+        self.assertTrue(all(q['id'] > first_page['next_after_id'] for q in data['questions']))
+        self.assertEqual(data['total_questions'], first_page['total_questions'])
+
     def test_404_request_beyond_valid_question_page(self):
         res = self.client().get('/questions?page=2000')
         data = json.loads(res.data)
@@ -147,6 +163,79 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['question'])
 
 
+    def test_quizzes_never_repeat_a_question(self):
+        previous_questions = []
+        while True:
+            res = self.client().post('/quizzes', json = {'previous_questions': previous_questions, 'quiz_category': {'type': 'Science', 'id': 1}})
+            if res.status_code == 404:
+                break
+            data = json.loads(res.data)
+            self.assertEqual(data['question']['category'], 1)
+            self.assertNotIn(data['question']['id'], previous_questions)
+            previous_questions.append(data['question']['id'])
+
+        self.assertTrue(previous_questions)
+
+
+    def test_quizzes_accept_string_ids(self):
+        previous_questions = []
+        while True:
+            res = self.client().post('/quizzes', json = {'previous_questions': [str(id) for id in previous_questions], 'quiz_category': {'type': 'Science', 'id': 1}})
+            if res.status_code == 404:
+                break
+            data = json.loads(res.data)
+            self.assertNotIn(data['question']['id'], previous_questions)
+            previous_questions.append(data['question']['id'])
+
+        self.assertTrue(previous_questions)
+
+
+    def test_422_malformed_quiz_request(self):
+        for body in ({'previous_questions': 5, 'quiz_category': {'id': 1}},
+                     {'previous_questions': [[1]], 'quiz_category': {'id': 1}},
+                     {'previous_questions': ['one'], 'quiz_category': {'id': 1}},
+                     {'previous_questions': [], 'quiz_category': 'Science'},
+                     ['not', 'an', 'object']):
+            res = self.client().post('/quizzes', json = body)
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 422, body)
+            self.assertEqual(data['success'], False)
+
+
+    def test_quiz_session(self):
+        res = self.client().post('/quizzes/sessions', json = {'quiz_category': {'type': 'Science', 'id': 1}})
+        session_id = json.loads(res.data)['session_id']
+
+        asked = []
+        res = self.client().post('/quizzes/sessions/' + session_id)
+        while res.status_code == 200:
+            data = json.loads(res.data)
+            self.assertEqual(data['session_id'], session_id)
+            self.assertNotIn(data['question']['id'], asked)
+            asked.append(data['question']['id'])
+            res = self.client().post('/quizzes/sessions/' + session_id)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertTrue(asked)
+
+
+    def test_422_malformed_quiz_session(self):
+        res = self.client().post('/quizzes/sessions', json = {'quiz_category': 'Science'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+
+    def test_404_unknown_quiz_session(self):
+        res = self.client().post('/quizzes/sessions/not-a-session')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+
     def test_get_questions_by_category(self):
         res = self.client().get('/categories/1/questions')
         data = json.loads(res.data)
@@ -158,9 +247,162 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
 
 
+    def test_questions_by_category_total_follows_inserts(self):
+        res = self.client().get('/categories/1/questions')
+        before = json.loads(res.data)['total_questions']
+        self.client().post('/questions', json=self.new_question)
+        res = self.client().get('/categories/1/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], before + 1)
+        self.assertLessEqual(len(data['questions']), 10)
+
 
+    def test_db_pool_stats(self):
+        self.client().get('/questions')
+        res = self.client().get('/health/db-pool')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['pool']['checkouts'])
+        self.assertTrue(data['pool']['pools'])
+
+
+    def test_get_questions_query_budget(self):
+        metrics = self.app.extensions['request_metrics']
+        with metrics.query_budget(3):
+            res = self.client().get('/questions')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('queries', res.headers['Server-Timing'])
 
 
+    def test_prometheus_metrics(self):
+        self.client().get('/questions')
+        res = self.client().get('/metrics')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'trivia_request_total{endpoint="get_questions"}', res.data)
+        self.assertIn(b'trivia_request_duration_seconds_bucket', res.data)
+
+
+
+
+
+
+
+class TriviaPerformanceTestCase(unittest.TestCase):
+    """Query count, peak memory and p95 latency budgets per endpoint, measured
+    against a throwaway SQLite database seeded with a large question bank.
+
+    TRIVIA_PERF_QUESTIONS sets the bank size (100000 by default). Query counts and
+    memory are deterministic and always checked; wall-clock p95 depends on the machine,
+    so it is only checked with TRIVIA_PERF_LATENCY=1.
+    """
+
+    num_questions = int(os.environ.get('TRIVIA_PERF_QUESTIONS', 100000))
+    check_latency = os.environ.get('TRIVIA_PERF_LATENCY') == '1'
+    num_categories = 6
+    runs = 40
+
+    @classmethod
+    def setUpClass(cls):
+        handle, cls.database_file = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        cls.app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + cls.database_file})
+        # the search index and cached counts may belong to a database used by an earlier test case
+        question_search.reset()
+        reset_question_counts()
+        categories_changed()
+        cls.metrics = cls.app.extensions['request_metrics']
+        with cls.app.app_context():
+            db.session.execute(Category.__table__.insert(),
+                               [{'type': 'Category %d' % i} for i in range(1, cls.num_categories + 1)])
+            db.session.execute(Question.__table__.insert(), [{
+                'question': 'Question %d about topic %d' % (i, i % 97),
+                'answer': 'Answer %d' % i,
+                'category': i % cls.num_categories + 1,
+                'difficulty': i % 5 + 1
+                } for i in range(1, cls.num_questions + 1)])
+            db.session.commit()
+        cls.client = cls.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.get_engine(cls.app).dispose()
+        question_search.reset()
+        reset_question_counts()
+        categories_changed()
+        os.remove(cls.database_file)
+
+    def request(self, method, path, body=None):
+        return self.client.open(path, method=method, json=body)
+
+    def assertWithinBudget(self, method, path, body=None, queries=None, peak_kib=None, p95_ms=None):
+        res = self.request(method, path, body) # warm up caches, decks and the search index
+        self.assertEqual(res.status_code, 200, res.data)
+
+        with self.metrics.query_budget(queries):
+            self.request(method, path, body)
+
+        tracemalloc.start()
+        try:
+            self.request(method, path, body)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertLessEqual(peak, peak_kib * 1024,
+                             '%s %s peaked at %d KiB, budget is %d KiB' % (method, path, peak // 1024, peak_kib))
+
+        if not self.check_latency:
+            return
+        timings = []
+        for _ in range(self.runs):
+            started = time.perf_counter()
+            self.request(method, path, body)
+            timings.append((time.perf_counter() - started) * 1000)
+        p95 = sorted(timings)[int(math.ceil(0.95 * len(timings))) - 1]
+        self.assertLessEqual(p95, p95_ms, '%s %s p95 is %.1f ms, budget is %d ms' % (method, path, p95, p95_ms))
+
+    def test_questions_first_page(self):
+        self.assertWithinBudget('GET', '/questions', queries=3, peak_kib=1024, p95_ms=50)
+
+    def test_questions_deep_page(self):
+        self.assertWithinBudget('GET', '/questions?after_id=%d' % (self.num_questions - 100),
+                                queries=3, peak_kib=1024, p95_ms=50)
+
+    def test_categories(self):
+        self.assertWithinBudget('GET', '/categories', queries=1, peak_kib=512, p95_ms=25)
+
+    def test_search(self):
+        self.assertWithinBudget('POST', '/questions/search', {'searchTerm': 'Question 4242 '},
+                                queries=1, peak_kib=2048, p95_ms=100)
+
+    def test_search_broad_term(self):
+        # every question matches: one bounded page, ranked and counted in SQL
+        for term in ('Question', 'Qu'):
+            self.assertWithinBudget('POST', '/questions/search', {'searchTerm': term},
+                                    queries=1, peak_kib=1024, p95_ms=400)
+
+        data = json.loads(self.request('POST', '/questions/search', {'searchTerm': 'Qu', 'offset': 100}).data)
+        self.assertEqual(data['total_questions'], self.num_questions)
+        self.assertEqual(len(data['questions']), SEARCH_RESULTS_LIMIT)
+
+    def test_questions_by_category(self):
+        self.assertWithinBudget('GET', '/categories/1/questions', queries=1, peak_kib=1024, p95_ms=50)
+
+    def test_questions_by_category_deep_page(self):
+        self.assertWithinBudget('GET', '/categories/1/questions?after_id=%d' % (self.num_questions // 2),
+                                queries=1, peak_kib=1024, p95_ms=50)
+
+    def test_quizzes(self):
+        previous = random.sample(range(1, self.num_questions + 1), 50)
+        self.assertWithinBudget('POST', '/quizzes', {'previous_questions': previous, 'quiz_category': {'id': 1}},
+                                queries=1, peak_kib=512, p95_ms=25)
 
 
 # Make the tests conveniently executable
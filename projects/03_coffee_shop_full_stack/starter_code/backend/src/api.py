@@ -4,12 +4,15 @@ from sqlalchemy import exc
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
+from .database.models import db_drop_and_create_all, setup_db, Drink, drink_cache
+from .database.pool import pool_metrics
+from .metrics import RequestMetrics
 from .auth.auth import AuthError, requires_auth
 
 app = Flask(__name__)
 setup_db(app)
 CORS(app)
+request_metrics = RequestMetrics(app, namespace='coffee_shop') # Server-Timing headers and GET /metrics
 
 '''
 @TODO uncomment the following line to initialize the database
@@ -35,15 +38,39 @@ CORS(app)
 
 
 
+'''
+menu_response(name, build_menu)
+    serves a list of drinks built by build_menu (Drink.short_menu or Drink.long_menu)
+    from drink_cache, with an ETag so an unchanged menu is answered 304 Not Modified
+'''
+def menu_response(name, build_menu):
+    def build():
+        drinks = build_menu()
+        if len(drinks) == 0:
+            abort(404) # Not found - when there are no drink
+        return json.dumps({'success': True, 'drinks': drinks})
+
+    body, etag = drink_cache.get(name, build)
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+'''
+GET /drinks?ingredient=milk
+    only lists drinks containing the ingredient, answered from the ingredient name index
+    (filtered menus are not cached)
+'''
 @app.route('/drinks')
 def get_drink():
+    ingredient = request.args.get('ingredient')
     try:
-        drinks = Drink.query.all()
-        result = [drink.short() for drink in drinks]
-        
-        if len(result) == 0:
-            abort(404) # Not found - when there are no drink
-        return jsonify({'success': True, 'drinks': result})
+        if ingredient is not None:
+            drinks = Drink.short_menu(ingredient=ingredient)
+            if len(drinks) == 0:
+                abort(404)
+            return jsonify({'success': True, 'drinks': drinks})
+        return menu_response('drinks', Drink.short_menu)
     except:
         abort(404) # not found
 
@@ -63,13 +90,7 @@ def get_drink():
 @requires_auth('get:drinks-detail')
 def get_drinks_detail(self):
     try:
-        drinks = Drink.query.all()
-        result = [drink.long() for drink in drinks]
-
-        if len(result) == 0:
-            abort(404) # Not found
-
-        return jsonify({'success': True, 'drinks': result})
+        return menu_response('drinks-detail', Drink.long_menu)
     except:
         abort(404) #Not found
 
@@ -98,7 +119,7 @@ def create_drink(self):
 
     try:
         print('>>> adding to db')
-        drink = Drink(title=title, recipe=json.dumps([recipe])) # recipe has to be passed as a list to work with the short() method
+        drink = Drink(title=title, recipe=recipe) # a single ingredient or a list of them
         print('>>> Drink added')
         drink.insert()
         print('>>> Drink inserted in DB')
@@ -139,7 +160,7 @@ def patch_drink(self, id):
         if title is not None:
             drink.title = title
         if recipe is not None:
-            drink.recipe = json.dumps(recipe)
+            drink.recipe = recipe
         drink.update()
 
         long_drink = drink.long() # necessary to pass in funciton return json
@@ -187,6 +208,20 @@ def delete_drink(self,id):
       abort(422)
 
 
+'''
+GET /health/db-pool
+    public endpoint
+    returns status code 200 and json {"success": True, "pool": stats} with the
+    connection pool counters of this worker process (see database/pool.py)
+'''
+@app.route('/health/db-pool')
+def db_pool_stats():
+    return jsonify({
+      'success': True,
+      'pool': pool_metrics.snapshot()
+      })
+
+
 ## Error Handling
 '''
 Example error handling for unprocessable entity
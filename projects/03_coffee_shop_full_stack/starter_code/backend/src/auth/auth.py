@@ -1,4 +1,9 @@
+import hashlib
 import json
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
 from flask import request, _request_ctx_stack, abort
 from functools import wraps
 from jose import jwt
@@ -8,6 +13,11 @@ from urllib.request import urlopen
 AUTH0_DOMAIN = 'fsdn.eu.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'drink'
+# overridable so tests and benchmarks can point at a local stub JWKS server
+JWKS_URL = os.environ.get('AUTH0_JWKS_URL', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+JWKS_TTL = 60 * 60 # seconds before the key set is fetched again
+JWKS_MIN_REFETCH_INTERVAL = 30 # seconds between fetches triggered by an unknown kid
+TOKEN_CACHE_SIZE = 1024 # verified tokens remembered per process
 
 ## AuthError Exception
 '''
@@ -20,6 +30,149 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+## JWKS cache
+'''
+JWKSCache
+    Auth0 signing keys, fetched once and kept in memory as JWK dicts keyed by kid
+    (python-jose-cryptodome 1.3.2's jwt.decode takes the dict, not a constructed key).
+    A background timer refreshes the key set before it expires, so verifying a token
+    normally never touches the network.
+    A token signed with an unknown kid (Auth0 rotated its keys) triggers a refetch,
+    at most once every min_refetch_interval seconds so bogus kids can't be used to hammer Auth0.
+    If a refresh fails the previous keys keep being served.
+'''
+class JWKSCache:
+    def __init__(self, url, ttl=JWKS_TTL, min_refetch_interval=JWKS_MIN_REFETCH_INTERVAL):
+        self.url = url
+        self.ttl = ttl
+        self.min_refetch_interval = min_refetch_interval
+        self._keys = {}
+        self._fetched_at = None
+        self._last_attempt = None
+        self._refresh_lock = threading.Lock()
+        self._timer = None
+
+    def _fetch(self):
+        with urlopen(self.url, timeout=10) as response:
+            jwks = json.loads(response.read())
+        keys = {}
+        for key in jwks['keys']:
+            if key.get('kty') != 'RSA' or 'kid' not in key:
+                continue
+            keys[key['kid']] = {
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key.get('use', 'sig'),
+                'n': key['n'],
+                'e': key['e']
+                }
+        return keys
+
+    def refresh(self, min_interval=0):
+        '''Fetches the key set unless another thread just did (or tried to, within min_interval).'''
+        with self._refresh_lock:
+            now = time.monotonic()
+            if self._last_attempt is not None and now - self._last_attempt < min_interval:
+                return
+            self._last_attempt = now
+            try:
+                self._keys = self._fetch()
+                self._fetched_at = now
+            finally:
+                self._schedule_refresh()
+
+    def _schedule_refresh(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(self.ttl * 0.9, self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception:
+            pass # keep serving the current keys, the next timer retries
+
+    def get(self, kid):
+        '''Public JWK for kid, or None if Auth0 doesn't publish it.'''
+        if self._fetched_at is None or time.monotonic() - self._fetched_at > self.ttl:
+            try:
+                self.refresh(min_interval=self.min_refetch_interval)
+            except Exception:
+                if not self._keys:
+                    raise
+                # stale keys are better than rejecting every request
+        key = self._keys.get(kid)
+        if key is None:
+            self.refresh(min_interval=self.min_refetch_interval)
+            key = self._keys.get(kid)
+        return key
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+
+
+jwks_cache = JWKSCache(JWKS_URL)
+
+
+## Verified token cache
+'''
+TokenCache
+    LRU of already verified tokens (VerifiedToken) keyed by the SHA-256 of the raw token (the token
+    itself is never kept as a key). An entry is dropped once the token's exp claim has
+    passed, so a cached token is never accepted after verification would reject it.
+    Tokens without exp are not cached.
+    hits and misses count lookups, to check the cache is doing its job.
+'''
+class TokenCache:
+    def __init__(self, max_size=TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token, verified):
+        expires_at = verified.payload.get('exp')
+        if not isinstance(expires_at, (int, float)):
+            return
+        with self._lock:
+            self._entries[self._key(token)] = (verified, expires_at)
+            self._entries.move_to_end(self._key(token))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+token_cache = TokenCache()
+
+
 ## Auth Header
 
 '''
@@ -81,22 +234,61 @@ def get_token_auth_header():
         !!NOTE check your RBAC settings in Auth0
     it should raise an AuthError if the requested permission string is not in the payload permissions array
     return true otherwise
+
+    requires_auth compiles its PermissionRequirement once, this helper builds one per call
 '''
 def check_permissions(permission, payload):
+    PermissionRequirement(permission).check(granted_permissions(payload))
+    return True
+
+'''
+granted_permissions(payload)
+    the token's permissions claim as a frozenset (None if the claim is missing),
+    computed once per verified token and cached with it
+'''
+def granted_permissions(payload):
     if 'permissions' not in payload:
-        raise AuthError({
-            'code': 'invalid claims',
-            'description': 'Permissions not included in JWT'
-            }, 400) # Bad request error code
+        return None
+    return frozenset(payload['permissions'])
 
-    #print(">>> payload['permissions']:", payload['permissions'] )
+'''
+PermissionRequirement
+    permissions a route needs, compiled when requires_auth decorates it
+        all_of: every one of these must be granted
+        any_of: at least one of these must be granted
+    permissions are 'action:resource'; a granted permission may use '*' for either
+    part, e.g. '*:drinks' grants every drinks permission and '*:*' grants everything.
+    Each required permission is expanded up front into the (at most 4) grants that
+    satisfy it, so checking a token is a few set lookups however many scopes it carries.
+    A requirement with no permissions at all (requires_auth() or check_permissions('', ...))
+    grants nothing, like the original check_permissions: every token gets a 403.
+'''
+def _satisfying_grants(permission):
+    action, sep, resource = permission.partition(':')
+    if not sep:
+        return frozenset([permission, '*:*'])
+    return frozenset([permission, '*:' + resource, action + ':*', '*:*'])
+
+class PermissionRequirement:
+    def __init__(self, *all_of, any_of=()):
+        self.all_of = tuple(_satisfying_grants(p) for p in all_of if p)
+        self.any_of = frozenset().union(*(_satisfying_grants(p) for p in any_of))
+        self.deny_all = not self.all_of and not self.any_of
+
+    def check(self, granted):
+        if granted is None:
+            raise AuthError({
+                'code': 'invalid claims',
+                'description': 'Permissions not included in JWT'
+                }, 400) # Bad request error code
 
-    if permission not in payload['permissions']:
-        raise AuthError({
-            'code': 'Permission not found',
-            'description': 'User does not have permission to do requested change'
-            }, 403) # Forbidden error code
-    return True
+        missing = self.deny_all or any(granted.isdisjoint(grants) for grants in self.all_of)
+        if missing or (self.any_of and granted.isdisjoint(self.any_of)):
+            raise AuthError({
+                'code': 'Permission not found',
+                'description': 'User does not have permission to do requested change'
+                }, 403) # Forbidden error code
+        return True
 
 '''
 [DONE]
@@ -115,33 +307,17 @@ def check_permissions(permission, payload):
 def verify_decode_jwt(token):
     '''Credit to Udacity's classes where it is shown how to verify and decode tokens
     Used the same structure as shown in the Udacity's classes'''
-    jsonurl =urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json') #open url where keys are found
-    print('>>> jsonurl:',jsonurl) # debugging
-    jwks = json.loads(jsonurl.read()) # load keys found in above url
-    #print('>>> jwks:', jwks) #debugging
-    
     unverified_header = jwt.get_unverified_header(token) # returns the JWT's header without doing any kind of validation
     #print('>>> unverified_header', unverified_header)
 
-    rsa_key = {}
     if 'kid' not in unverified_header: # The "kid" (key ID) Header Parameter is a hint indicating which key was used to secure the JWS.
         raise AuthError({
             'code': 'invalid error',
             'description': 'Authorization malformed'
             }, 401)
-    # verify the token using Auth0 /.well-known/jwks.json    
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-            'kty': key['kty'],
-            'kid': key['kid'],
-            'use': key['use'],
-            'n': key['n'],
-            'e': key['e']
-            }
-    #print('>>> rsa_key:', rsa_key)
+    # verify the token using the cached Auth0 /.well-known/jwks.json keys
+    rsa_key = jwks_cache.get(unverified_header['kid'])
     if rsa_key:
-        print('>>> passed if rsa_key')
         # decode the payload
         try:
             payload = jwt.decode(
@@ -183,32 +359,51 @@ def verify_decode_jwt(token):
 
 
 
+'''
+verify_token(token)
+    verify_decode_jwt() with the token cache in front of it: a token seen before
+    skips the RSA signature check and claims validation until it expires.
+    Returns a VerifiedToken (payload, permissions frozenset)
+'''
+VerifiedToken = namedtuple('VerifiedToken', ['payload', 'permissions'])
+
+def verify_token(token):
+    verified = token_cache.get(token)
+    if verified is None:
+        payload = verify_decode_jwt(token)
+        verified = VerifiedToken(payload, granted_permissions(payload))
+        token_cache.put(token, verified)
+    return verified
+
+
 '''
 @TODO implement @requires_auth(permission) decorator method
     @INPUTS
         permission: string permission (i.e. 'post:drink')
+        more permissions can be listed, all of them are then required:
+            @requires_auth('patch:drinks', 'get:drinks-detail')
+        or pass any_of to require at least one of them:
+            @requires_auth(any_of=['patch:drinks', 'delete:drinks'])
 
     it should use the get_token_auth_header method to get the token [DONE]
     it should use the verify_decode_jwt method to decode the jwt [DONE]
-    it should use the check_permissions method validate claims and check the requested permission []
-    return the decorator which passes the decoded payload to the decorated method []
+    it should use the check_permissions method validate claims and check the requested permission [DONE]
+    return the decorator which passes the decoded payload to the decorated method [DONE]
 '''
-def requires_auth(permission=''):
+def requires_auth(permission='', *permissions, any_of=()):
+    requirement = PermissionRequirement(permission, *permissions, any_of=any_of)
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            #print('>>> running requires_auth') #debugging
             token = get_token_auth_header()
             try:
-                #print('>>> running_verify_jwt')
-                payload = verify_decode_jwt(token)
+                verified = verify_token(token)
             except:
                 abort(401)
-            
-            #print('>>> running check_permissions')
-            #print('>>> permission:', permission)
-            check_permissions(permission, payload)
-            return f(payload, *args, **kwargs) # return the payload to the decorated function
+
+            requirement.check(verified.permissions)
+            return f(verified.payload, *args, **kwargs) # return the payload to the decorated function
 
         return wrapper
-    return requires_auth_decorator
\ No newline at end of file
+    return requires_auth_decorator
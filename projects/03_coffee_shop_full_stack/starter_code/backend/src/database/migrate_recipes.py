@@ -0,0 +1,138 @@
+'''
+One-off migration between the two drink schemas:
+    legacy:  drink(id, title, recipe)       recipe a JSON string
+    current: drink(id, title) + ingredient  one row per recipe item
+
+Run it from the backend directory, with the app stopped:
+
+    python -m src.database.migrate_recipes upgrade
+    python -m src.database.migrate_recipes downgrade
+
+--database overrides the database URL (DATABASE_URL or the bundled SQLite file by default).
+A SQLite file is copied to <file>.<timestamp>.bak before anything changes; take a dump
+first on other databases. Each direction runs in one transaction and rebuilds the drink
+table (create, copy, drop, rename) instead of ALTER TABLE ... DROP COLUMN, which SQLite
+only supports from 3.35.
+'''
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, UniqueConstraint, create_engine, inspect
+
+from .models import Drink, Ingredient, database_path, normalize_recipe
+
+'''
+legacy_drink_table(name)
+    the drink table as created by the versions that stored recipes as JSON
+'''
+def legacy_drink_table(name):
+    return Table(
+        name, MetaData(),
+        Column('id', Integer, primary_key=True),
+        Column('title', String(80)),
+        Column('recipe', String(180), nullable=False),
+        UniqueConstraint('title'))
+
+'''
+current_drink_table(name)
+    Drink's table under another name, to be renamed into place
+'''
+def current_drink_table(name):
+    return Table(name, MetaData(), *[column.copy() for column in Drink.__table__.columns])
+
+def schema_of(engine):
+    inspector = inspect(engine)
+    if 'drink' not in inspector.get_table_names():
+        return None
+    columns = [column['name'] for column in inspector.get_columns('drink')]
+    return 'legacy' if 'recipe' in columns else 'current'
+
+def backup(url):
+    '''copies a SQLite database file aside, returns the copy's path (None for other databases)'''
+    if not url.startswith('sqlite:///') or url == 'sqlite://':
+        return None
+    path = url[len('sqlite:///'):]
+    if not os.path.exists(path):
+        return None
+    stamp = time.strftime('%Y%m%d%H%M%S')
+    copy, n = '%s.%s.bak' % (path, stamp), 1
+    while os.path.exists(copy): # never overwrite an earlier backup
+        copy, n = '%s.%s-%d.bak' % (path, stamp, n), n + 1
+    shutil.copy2(path, copy)
+    return copy
+
+def rebuild_drink_table(connection, new_table, rows):
+    '''replaces the drink table with new_table holding rows'''
+    new_table.create(connection)
+    if rows:
+        connection.execute(new_table.insert(), rows)
+    connection.execute('DROP TABLE drink')
+    connection.execute('ALTER TABLE %s RENAME TO drink' % new_table.name)
+    if connection.dialect.name == 'postgresql':
+        # the copied rows carry their ids, move the new table's id sequence past them
+        connection.execute("SELECT setval(pg_get_serial_sequence('drink', 'id'), "
+                           "COALESCE((SELECT MAX(id) FROM drink), 0) + 1, false)")
+
+'''
+upgrade(engine)
+    legacy -> current: every recipe becomes ingredient rows, the recipe column goes away
+'''
+def upgrade(engine):
+    with engine.begin() as connection:
+        drinks = connection.execute('SELECT id, title, recipe FROM drink').fetchall()
+        # left empty by the automatic migration earlier versions attempted on start-up
+        connection.execute('DROP TABLE IF EXISTS ingredient')
+        rebuild_drink_table(connection, current_drink_table('drink_migrating'),
+                            [{'id': id, 'title': title} for id, title, _ in drinks])
+        # created once drink is rebuilt: no foreign key may point at the drink table being dropped
+        Ingredient.__table__.create(connection)
+        ingredients = [dict(item, drink_id=id, position=position)
+                       for id, _, recipe in drinks
+                       for position, item in enumerate(normalize_recipe(recipe))]
+        if ingredients:
+            connection.execute(Ingredient.__table__.insert(), ingredients)
+    return len(drinks)
+
+'''
+downgrade(engine)
+    current -> legacy: ingredient rows are folded back into each drink's JSON recipe
+'''
+def downgrade(engine):
+    with engine.begin() as connection:
+        recipes = {}
+        for drink_id, name, color, parts in connection.execute(
+                'SELECT drink_id, name, color, parts FROM ingredient ORDER BY drink_id, position'):
+            recipes.setdefault(drink_id, []).append({'name': name, 'color': color, 'parts': parts})
+        drinks = connection.execute('SELECT id, title FROM drink').fetchall()
+        # dropped first, its foreign key would block dropping the drink table
+        connection.execute('DROP TABLE ingredient')
+        rebuild_drink_table(connection, legacy_drink_table('drink_migrating'), [
+            {'id': id, 'title': title, 'recipe': json.dumps(recipes.get(id, []))} for id, title in drinks])
+    return len(drinks)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('direction', choices=['upgrade', 'downgrade'])
+    parser.add_argument('--database', default=database_path, help='SQLAlchemy database URL')
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.database)
+    expected = 'legacy' if args.direction == 'upgrade' else 'current'
+    schema = schema_of(engine)
+    if schema != expected:
+        print('Nothing to %s: the drink table is %s' % (args.direction, schema or 'missing'))
+        return 0
+    copy = backup(args.database)
+    if copy:
+        print('Backed up the database to %s' % copy)
+    count = (upgrade if args.direction == 'upgrade' else downgrade)(engine)
+    print('Migrated %d drinks (%s)' % (count, args.direction))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,17 @@
 import os
-from sqlalchemy import Column, String, Integer
+import hashlib
+import threading
+import time
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, inspect
+from sqlalchemy.orm import relationship
 from flask_sqlalchemy import SQLAlchemy
+from .pool import engine_options
 import json
 
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
-database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
+# DATABASE_URL points the app at another database (e.g. a throwaway copy for load tests)
+database_path = os.environ.get('DATABASE_URL', "sqlite:///{}".format(os.path.join(project_dir, database_filename)))
 #print('>>>project_dir',project_dir)
 #print('>>>database_path',database_path)
 
@@ -18,8 +24,10 @@ setup_db(app)
 def setup_db(app):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
     db.app = app
     db.init_app(app)
+    check_schema()
 
 '''
 db_drop_and_create_all()
@@ -32,6 +40,91 @@ def db_drop_and_create_all():
     db.create_all()
     print('DB created')
 
+'''
+check_schema()
+    refuses to start on a database still in the pre-ingredient layout (drink.recipe as a
+    JSON column), which is converted by the explicit, one-off migration in migrate_recipes.py
+'''
+def check_schema():
+    inspector = inspect(db.engine)
+    if 'drink' not in inspector.get_table_names():
+        return
+    if 'recipe' in [column['name'] for column in inspector.get_columns('drink')]:
+        raise RuntimeError('The drink table still stores recipes as JSON. Stop the app, then run '
+                           '"python -m src.database.migrate_recipes upgrade" from the backend directory.')
+
+'''
+normalize_recipe(recipe)
+    accepts a recipe as sent by clients or stored by older versions (a JSON string,
+    a single ingredient dict or a list of them) and returns a list of
+    {'name', 'color', 'parts'} dicts
+'''
+def normalize_recipe(recipe):
+    if isinstance(recipe, str):
+        recipe = json.loads(recipe)
+    if isinstance(recipe, dict):
+        recipe = [recipe]
+    return [{'name': r['name'], 'color': r['color'], 'parts': r['parts']} for r in recipe]
+
+'''
+DrinkCache
+    read-through cache for the drinks menu: a value is built on first use (e.g. the
+    serialized GET /drinks body) and served from memory until Drink.insert/update/delete
+    runs in this process. ttl bounds how long writes made by other processes go unnoticed.
+    Every value carries an ETag derived from its content, so clients holding an
+    unchanged menu can be answered 304 straight from memory.
+'''
+DRINK_CACHE_TTL = 60 # seconds
+
+class DrinkCache:
+    def __init__(self, ttl=DRINK_CACHE_TTL):
+        self.ttl = ttl
+        self._generation = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def get(self, name, build):
+        '''returns (value, etag) for name, calling build() to render the value (a str) on a miss'''
+        now = time.monotonic()
+        with self._lock:
+            generation = self._generation
+            entry = self._entries.get(name)
+        if entry is not None and now - entry[2] < self.ttl:
+            return entry[0], entry[1]
+        value = build()
+        etag = hashlib.sha1(value.encode('utf-8')).hexdigest()
+        with self._lock:
+            if generation == self._generation: # don't store a value built before a concurrent write
+                self._entries[name] = (value, etag, now)
+        return value, etag
+
+drink_cache = DrinkCache()
+
+'''
+Ingredient
+one line of a drink's recipe, kept in recipe order by position
+'''
+class Ingredient(db.Model):
+    id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
+    drink_id = Column(Integer, ForeignKey('drink.id', ondelete='CASCADE'), nullable=False)
+    position = Column(Integer, nullable=False)
+    # indexed so "drinks containing milk" doesn't scan every recipe
+    name = Column(String(80), nullable=False, index=True)
+    color = Column(String(80), nullable=False)
+    parts = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index('ix_ingredient_drink_id_position', 'drink_id', 'position'),
+    )
+
+    def format(self):
+        return {'color': self.color, 'name': self.name, 'parts': self.parts}
+
 '''
 Drink
 a persistent drink entity, extends the base SQLAlchemy Model
@@ -41,17 +134,31 @@ class Drink(db.Model):
     id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
     # String Title
     title = Column(String(80), unique=True)
-    # the ingredients blob - this stores a lazy json blob
-    # the required datatype is [{'color': string, 'name':string, 'parts':number}]
-    recipe =  Column(String(180), nullable=False)
+    # the recipe, one Ingredient row per item
+    # exposed as the datatype [{'color': string, 'name':string, 'parts':number}] by the recipe property
+    ingredients = relationship('Ingredient', order_by='Ingredient.position', lazy='selectin',
+                               cascade='all, delete-orphan')
+
+    '''
+    recipe
+        the recipe as a list of {'color', 'name', 'parts'} dicts
+        can be assigned a list, a single dict or a JSON string
+    '''
+    @property
+    def recipe(self):
+        return [ingredient.format() for ingredient in self.ingredients]
+
+    @recipe.setter
+    def recipe(self, recipe):
+        self.ingredients = [Ingredient(position=position, **item)
+                            for position, item in enumerate(normalize_recipe(recipe))]
 
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
+        short_recipe = [{'color': i.color, 'parts': i.parts} for i in self.ingredients]
         return {
             'id': self.id,
             'title': self.title,
@@ -66,9 +173,37 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': self.recipe
         }
 
+    '''
+    short_menu(ingredient=None)
+        short() of every drink (optionally only drinks containing the named ingredient),
+        built from two narrow queries that select just the columns short() shows
+    '''
+    @classmethod
+    def short_menu(cls, ingredient=None):
+        drinks = db.session.query(cls.id, cls.title).order_by(cls.id)
+        if ingredient is not None:
+            drinks = drinks.filter(cls.id.in_(
+                db.session.query(Ingredient.drink_id).filter(Ingredient.name == ingredient)))
+        menu = {id: {'id': id, 'title': title, 'recipe': []} for id, title in drinks}
+        if menu:
+            parts = db.session.query(Ingredient.drink_id, Ingredient.color, Ingredient.parts) \
+                .filter(Ingredient.drink_id.in_(menu.keys())) \
+                .order_by(Ingredient.drink_id, Ingredient.position)
+            for drink_id, color, amount in parts:
+                menu[drink_id]['recipe'].append({'color': color, 'parts': amount})
+        return list(menu.values())
+
+    '''
+    long_menu()
+        long() of every drink, ingredients loaded with one extra query
+    '''
+    @classmethod
+    def long_menu(cls):
+        return [drink.long() for drink in cls.query.order_by(cls.id).all()]
+
     '''
     insert()
         inserts a new model into a database
@@ -81,6 +216,7 @@ class Drink(db.Model):
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        drink_cache.invalidate()
 
     '''
     delete()
@@ -93,6 +229,7 @@ class Drink(db.Model):
     def delete(self):
         db.session.delete(self)
         db.session.commit()
+        drink_cache.invalidate()
 
     '''
     update()
@@ -105,6 +242,7 @@ class Drink(db.Model):
     '''
     def update(self):
         db.session.commit()
+        drink_cache.invalidate()
 
     def __repr__(self):
         return json.dumps(self.short())
\ No newline at end of file
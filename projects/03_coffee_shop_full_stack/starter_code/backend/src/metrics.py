@@ -0,0 +1,209 @@
+'''
+Per-request query and latency metrics.
+
+Shared by Fyyur, the trivia API and the coffee shop. projects/shared/metrics.py
+is the original; each app carries a byte-identical copy, kept in sync by
+projects/shared/vendor.py.
+
+RequestMetrics is a Flask extension. It counts the SQL statements each
+request runs and the time they take, by listening to SQLAlchemy's
+before/after_cursor_execute. It also times the whole request. Every response
+gets a Server-Timing header, readable in the browser's network panel:
+
+    Server-Timing: db;dur=4.20;desc="7 queries", db-slowest;dur=1.90, app;dur=12.51
+
+Totals per endpoint are served in Prometheus text format at /metrics.
+
+Tests can fail when a route runs more queries than expected (the extension is
+also reachable as app.extensions['request_metrics']):
+
+    with request_metrics.query_budget(3):
+        client.get('/venues')
+'''
+
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from threading import Lock
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_PREVIEW = 200 # characters of the slowest statement kept per endpoint
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestStats:
+    '''What a single request did.'''
+    __slots__ = ('endpoint', 'queries', 'db_seconds', 'slowest_seconds', 'slowest_statement', 'started', 'seconds')
+
+    def __init__(self):
+        self.endpoint = None
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_statement = None
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+
+class EndpointStats:
+    '''Running totals for one endpoint.'''
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.queries_max = 0
+        self.db_seconds = 0.0
+        self.seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.slowest_seconds = 0.0
+        self.slowest_statement = None
+
+    def add(self, stats):
+        self.requests += 1
+        self.queries += stats.queries
+        self.queries_max = max(self.queries_max, stats.queries)
+        self.db_seconds += stats.db_seconds
+        self.seconds += stats.seconds
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if stats.seconds <= bound:
+                self.buckets[i] += 1
+        if stats.slowest_seconds > self.slowest_seconds:
+            self.slowest_seconds = stats.slowest_seconds
+            self.slowest_statement = stats.slowest_statement
+
+
+def _current():
+    if not has_request_context():
+        return None # CLI commands, app start-up
+    return g.get('_request_stats')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # kept on the statement's execution context rather than on the pooled connection:
+    # a statement that raises never reaches the after hook, and its start time must
+    # go away with it instead of being popped by the next statement
+    started = time.perf_counter()
+    if context is not None:
+        context._metrics_started = started
+    else:
+        conn.info['query_started'] = started # one slot, overwritten by the next statement
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        started = context.__dict__.pop('_metrics_started', None)
+    else:
+        started = conn.info.pop('query_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    stats = _current()
+    if stats is None:
+        return
+    stats.queries += 1
+    stats.db_seconds += elapsed
+    if elapsed > stats.slowest_seconds:
+        stats.slowest_seconds = elapsed
+        stats.slowest_statement = statement[:STATEMENT_PREVIEW]
+
+
+def listen_to_engines():
+    '''Registers the cursor listeners once per process, on the Engine class: Flask-SQLAlchemy
+    creates a new engine when the database URI changes (tests, benchmarks) and every one is covered.'''
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+class RequestMetrics:
+    def __init__(self, app=None, namespace='app', server_timing=True):
+        self.namespace = namespace
+        self.server_timing = server_timing
+        self.endpoints = defaultdict(EndpointStats)
+        self.last = None # RequestStats of the most recent request, for tests
+        self._budgets = []
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        listen_to_engines()
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self.prometheus)
+        app.extensions['request_metrics'] = self
+
+    def _start_request(self):
+        g._request_stats = RequestStats()
+
+    def _finish_request(self, response):
+        stats = g.pop('_request_stats', None)
+        if stats is None:
+            return response
+        stats.endpoint = request.endpoint or 'unmatched'
+        stats.seconds = time.perf_counter() - stats.started
+        with self._lock:
+            self.endpoints[stats.endpoint].add(stats)
+            self.last = stats
+            for budget in self._budgets:
+                budget.append(stats)
+        if self.server_timing:
+            response.headers.add('Server-Timing', 'db;dur=%.2f;desc="%d queries", db-slowest;dur=%.2f, app;dur=%.2f' % (
+                stats.db_seconds * 1000, stats.queries, stats.slowest_seconds * 1000, stats.seconds * 1000))
+        return response
+
+    @contextmanager
+    def query_budget(self, max_queries):
+        '''Fails with QueryBudgetExceeded if a request made inside the block ran more than max_queries statements.'''
+        seen = []
+        with self._lock:
+            self._budgets.append(seen)
+        try:
+            yield seen
+        finally:
+            with self._lock:
+                self._budgets.remove(seen)
+        for stats in seen:
+            if stats.queries > max_queries:
+                raise QueryBudgetExceeded('%s ran %d queries, budget is %d (slowest: %s)' % (
+                    stats.endpoint, stats.queries, max_queries, stats.slowest_statement))
+
+    def prometheus(self):
+        name = self.namespace + '_request'
+        lines = []
+
+        def metric(suffix, kind, help, samples):
+            lines.append('# HELP %s_%s %s' % (name, suffix, help))
+            lines.append('# TYPE %s_%s %s' % (name, suffix, kind))
+            lines.extend('%s_%s%s %s' % (name, suffix, labels, value) for labels, value in samples)
+
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+            label = lambda endpoint: '{endpoint="%s"}' % endpoint
+            metric('total', 'counter', 'Requests handled.',
+                   [(label(e), s.requests) for e, s in endpoints])
+            metric('queries_total', 'counter', 'SQL statements run while handling requests.',
+                   [(label(e), s.queries) for e, s in endpoints])
+            metric('queries_max', 'gauge', 'Most SQL statements run by a single request.',
+                   [(label(e), s.queries_max) for e, s in endpoints])
+            metric('db_seconds_total', 'counter', 'Time spent in SQL statements.',
+                   [(label(e), '%.6f' % s.db_seconds) for e, s in endpoints])
+            metric('slowest_query_seconds', 'gauge', 'Slowest single SQL statement.',
+                   [(label(e), '%.6f' % s.slowest_seconds) for e, s in endpoints])
+            samples = []
+            for e, s in endpoints:
+                for bound, count in zip(LATENCY_BUCKETS, s.buckets):
+                    samples.append(('{endpoint="%s",le="%s"}' % (e, bound), count))
+                samples.append(('{endpoint="%s",le="+Inf"}' % e, s.requests))
+            metric('duration_seconds', 'histogram', 'Request handling time.', [])
+            lines.extend('%s_duration_seconds_bucket%s %s' % (name, labels, value) for labels, value in samples)
+            lines.extend('%s_duration_seconds_sum%s %.6f' % (name, label(e), s.seconds) for e, s in endpoints)
+            lines.extend('%s_duration_seconds_count%s %d' % (name, label(e), s.requests) for e, s in endpoints)
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
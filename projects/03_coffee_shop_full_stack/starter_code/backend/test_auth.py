@@ -0,0 +1,191 @@
+import base64
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from Crypto.PublicKey import RSA
+from jose import jwt
+
+from src.auth import auth
+from src.auth.auth import AuthError, JWKSCache, PermissionRequirement, TokenCache, VerifiedToken, \
+    check_permissions, verify_decode_jwt, verify_token
+
+
+def b64_uint(value):
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+class VerifyDecodeJwtTestCase(unittest.TestCase):
+    """Verifies real RS256 tokens against a key set served from a local file.
+
+        python -m unittest test_auth
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.kid = 'test-key'
+        key = RSA.generate(2048)
+        cls.private_pem = key.exportKey('PEM').decode('ascii')
+        handle, cls.jwks_file = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(handle, 'w') as jwks_file:
+            json.dump({'keys': [{
+                'kty': 'RSA',
+                'kid': cls.kid,
+                'use': 'sig',
+                'alg': 'RS256',
+                'n': b64_uint(key.n),
+                'e': b64_uint(key.e)
+                }]}, jwks_file)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.jwks_file)
+
+    def setUp(self):
+        self.real_jwks_cache = auth.jwks_cache
+        auth.jwks_cache = JWKSCache('file://' + self.jwks_file)
+
+    def tearDown(self):
+        auth.jwks_cache.stop()
+        auth.jwks_cache = self.real_jwks_cache
+
+    def token(self, kid=None, **claims):
+        now = int(time.time())
+        payload = {
+            'iss': 'https://' + auth.AUTH0_DOMAIN + '/',
+            'aud': auth.API_AUDIENCE,
+            'sub': 'auth0|test',
+            'iat': now,
+            'exp': now + 60,
+            'permissions': ['get:drinks-detail']
+            }
+        payload.update(claims)
+        return jwt.encode(payload, self.private_pem, algorithm='RS256', headers={'kid': kid or self.kid})
+
+    def test_decodes_valid_token(self):
+        payload = verify_decode_jwt(self.token())
+
+        self.assertEqual(payload['sub'], 'auth0|test')
+        self.assertEqual(payload['permissions'], ['get:drinks-detail'])
+
+    def test_401_wrong_audience(self):
+        with self.assertRaises(AuthError) as raised:
+            verify_decode_jwt(self.token(aud='another-api'))
+
+        self.assertEqual(raised.exception.status_code, 401)
+
+    def test_401_expired_token(self):
+        with self.assertRaises(AuthError) as raised:
+            verify_decode_jwt(self.token(exp=int(time.time()) - 10))
+
+        self.assertEqual(raised.exception.status_code, 401)
+
+    def test_400_unknown_kid(self):
+        with self.assertRaises(AuthError) as raised:
+            verify_decode_jwt(self.token(kid='rotated-away'))
+
+        self.assertEqual(raised.exception.status_code, 400)
+
+    def test_cached_token_skips_verification(self):
+        auth.token_cache = TokenCache()
+        try:
+            token = self.token()
+            with mock.patch.object(auth.jwt, 'decode', wraps=jwt.decode) as decode:
+                first = verify_token(token)
+                second = verify_token(token)
+
+            self.assertEqual(decode.call_count, 1)
+            self.assertEqual(second, first)
+            self.assertEqual(second.permissions, frozenset(['get:drinks-detail']))
+            self.assertEqual((auth.token_cache.hits, auth.token_cache.misses), (1, 1))
+        finally:
+            auth.token_cache = TokenCache()
+
+
+class TokenCacheTestCase(unittest.TestCase):
+
+    def verified(self, exp):
+        payload = {'sub': 'auth0|test', 'permissions': []}
+        if exp is not None:
+            payload['exp'] = exp
+        return VerifiedToken(payload, frozenset())
+
+    def test_counts_hits_and_misses(self):
+        cache = TokenCache()
+        verified = self.verified(time.time() + 60)
+
+        self.assertIsNone(cache.get('token'))
+        cache.put('token', verified)
+        self.assertIs(cache.get('token'), verified)
+        self.assertIs(cache.get('token'), verified)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_expires_at_exp(self):
+        cache = TokenCache()
+        now = time.time()
+        cache.put('token', self.verified(now + 60))
+
+        with mock.patch.object(auth.time, 'time', return_value=now + 59):
+            self.assertIsNotNone(cache.get('token'))
+        with mock.patch.object(auth.time, 'time', return_value=now + 60):
+            self.assertIsNone(cache.get('token'))
+        self.assertEqual(len(cache), 0)
+
+    def test_token_without_exp_is_not_cached(self):
+        cache = TokenCache()
+        cache.put('token', self.verified(None))
+
+        self.assertEqual(len(cache), 0)
+        self.assertIsNone(cache.get('token'))
+
+    def test_evicts_least_recently_used(self):
+        cache = TokenCache(max_size=2)
+        exp = time.time() + 60
+        for token in ('a', 'b'):
+            cache.put(token, self.verified(exp))
+        cache.get('a') # 'b' is now the least recently used
+        cache.put('c', self.verified(exp))
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+
+
+class PermissionRequirementTestCase(unittest.TestCase):
+
+    def test_granted_permission(self):
+        self.assertTrue(PermissionRequirement('post:drinks').check(frozenset(['post:drinks'])))
+        self.assertTrue(PermissionRequirement('post:drinks').check(frozenset(['*:drinks'])))
+
+    def test_403_missing_permission(self):
+        with self.assertRaises(AuthError) as raised:
+            PermissionRequirement('post:drinks').check(frozenset(['get:drinks-detail']))
+
+        self.assertEqual(raised.exception.status_code, 403)
+
+    def test_400_permissions_claim_missing(self):
+        with self.assertRaises(AuthError) as raised:
+            check_permissions('post:drinks', {'sub': 'auth0|test'})
+
+        self.assertEqual(raised.exception.status_code, 400)
+
+    def test_403_empty_permission(self):
+        # requires_auth() without a permission never grants access
+        for requirement in (PermissionRequirement(), PermissionRequirement('')):
+            with self.assertRaises(AuthError) as raised:
+                requirement.check(frozenset(['get:drinks-detail', '*:*']))
+            self.assertEqual(raised.exception.status_code, 403)
+
+        with self.assertRaises(AuthError) as raised:
+            check_permissions('', {'permissions': ['get:drinks-detail']})
+        self.assertEqual(raised.exception.status_code, 403)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
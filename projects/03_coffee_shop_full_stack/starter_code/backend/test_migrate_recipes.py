@@ -0,0 +1,80 @@
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from src.database import migrate_recipes
+
+
+class MigrateRecipesTestCase(unittest.TestCase):
+    """Upgrades a database in the legacy layout (drink.recipe as JSON) and back.
+
+        python -m unittest test_migrate_recipes
+    """
+
+    recipes = {
+        1: {'name': 'water', 'color': 'blue', 'parts': 1},
+        3: [{'name': 'milk', 'color': 'grey', 'parts': 1}, {'name': 'coffee', 'color': 'brown', 'parts': 2}],
+    }
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'database.db')
+        self.url = 'sqlite:///' + self.path
+        connection = sqlite3.connect(self.path)
+        connection.execute('CREATE TABLE drink (id INTEGER NOT NULL, title VARCHAR(80), '
+                           'recipe VARCHAR(180) NOT NULL, PRIMARY KEY (id), UNIQUE (title))')
+        connection.executemany('INSERT INTO drink VALUES (?, ?, ?)',
+                               [(id, 'Drink %d' % id, json.dumps(recipe)) for id, recipe in self.recipes.items()])
+        connection.commit()
+        connection.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def query(self, sql):
+        connection = sqlite3.connect(self.path)
+        try:
+            return connection.execute(sql).fetchall()
+        finally:
+            connection.close()
+
+    def columns(self, table):
+        return [row[1] for row in self.query('PRAGMA table_info(%s)' % table)]
+
+    def backups(self):
+        return [name for name in os.listdir(self.directory) if name.endswith('.bak')]
+
+    def test_upgrade(self):
+        migrate_recipes.main(['upgrade', '--database', self.url])
+
+        self.assertEqual(self.columns('drink'), ['id', 'title'])
+        self.assertEqual(self.query('SELECT id, title FROM drink ORDER BY id'), [(1, 'Drink 1'), (3, 'Drink 3')])
+        self.assertEqual(self.query('SELECT drink_id, position, name, color, parts FROM ingredient '
+                                    'ORDER BY drink_id, position'),
+                         [(1, 0, 'water', 'blue', 1), (3, 0, 'milk', 'grey', 1), (3, 1, 'coffee', 'brown', 2)])
+        self.assertEqual(len(self.backups()), 1)
+
+    def test_upgrade_twice_is_a_no_op(self):
+        migrate_recipes.main(['upgrade', '--database', self.url])
+        migrate_recipes.main(['upgrade', '--database', self.url])
+
+        self.assertEqual(len(self.query('SELECT * FROM ingredient')), 3)
+        self.assertEqual(len(self.backups()), 1)
+
+    def test_downgrade_restores_json_recipes(self):
+        migrate_recipes.main(['upgrade', '--database', self.url])
+        migrate_recipes.main(['downgrade', '--database', self.url])
+
+        self.assertEqual(self.columns('drink'), ['id', 'title', 'recipe'])
+        self.assertNotIn(('ingredient',), self.query("SELECT name FROM sqlite_master WHERE type = 'table'"))
+        recipes = {id: json.loads(recipe) for id, recipe in self.query('SELECT id, recipe FROM drink')}
+        self.assertEqual(recipes, {1: [self.recipes[1]], 3: self.recipes[3]})
+        self.assertEqual(len(self.backups()), 2)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+'''
+Local stand-in for Auth0.
+
+Generates an RSA key pair, serves its public half as a JSON Web Key Set over
+HTTP on localhost, and mints RS256 access tokens that the coffee shop's
+requires_auth accepts once AUTH0_JWKS_URL points at the stub.
+'''
+
+import base64
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ISSUER = 'https://fsdn.eu.auth0.com/'
+AUDIENCE = 'drink'
+BARISTA_PERMISSIONS = ['get:drinks-detail']
+MANAGER_PERMISSIONS = ['get:drinks-detail', 'post:drinks', 'patch:drinks', 'delete:drinks']
+
+
+def _b64_uint(value):
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+class StubAuth0:
+    def __init__(self, host='127.0.0.1', port=0):
+        # same crypto stack as the coffee shop (python-jose-cryptodome), imported
+        # here so the other scenarios run without it
+        from Crypto.PublicKey import RSA
+
+        self.kid = uuid.uuid4().hex
+        self._key = RSA.generate(2048)
+        self._private_pem = self._key.exportKey('PEM').decode('ascii')
+        jwks = json.dumps({'keys': [{
+            'kty': 'RSA',
+            'kid': self.kid,
+            'use': 'sig',
+            'alg': 'RS256',
+            'n': _b64_uint(self._key.n),
+            'e': _b64_uint(self._key.e),
+        }]}).encode('utf-8')
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/.well-known/jwks.json':
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(jwks)))
+                self.end_headers()
+                self.wfile.write(jwks)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def jwks_url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%d/.well-known/jwks.json' % (host, port)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def mint(self, permissions, subject=None, ttl=3600):
+        '''Signed access token carrying permissions, valid for ttl seconds.'''
+        from jose import jwt
+
+        now = int(time.time())
+        claims = {
+            'iss': ISSUER,
+            'aud': AUDIENCE,
+            'sub': subject or 'loadtest|%s' % uuid.uuid4().hex[:12],
+            'iat': now,
+            'exp': now + ttl,
+            'permissions': list(permissions),
+        }
+        return jwt.encode(claims, self._private_pem, algorithm='RS256', headers={'kid': self.kid})
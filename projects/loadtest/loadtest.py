@@ -0,0 +1,265 @@
+'''
+Load benchmark for the course apps.
+
+Boots an app against a freshly seeded local database (serve.py), drives it with
+concurrent virtual users running the app's scenario (scenarios.py) and writes
+a JSON report with throughput, latency percentiles and error rate, overall
+and per step.
+
+    python loadtest.py trivia --users 20 --duration 30 --report reports/trivia.json
+    python loadtest.py all --users 10 --duration 15
+
+The coffee shop runs against a local stand-in for Auth0 (jwt_stub.py), so it
+needs python-jose-cryptodome installed in the environment running this script.
+Reports carry the git commit they were run on; compare runs made with the
+same --users, --duration and --size.
+'''
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from scenarios import SCENARIOS, READY_PATHS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = {'fyyur': 1000, 'trivia': 10000, 'coffee_shop': 200}
+PERCENTILES = (50, 90, 95, 99)
+
+
+class Context:
+    '''Shared, read-only facts about the run handed to every scenario call.'''
+
+    def __init__(self, size, tokens=()):
+        self.size = size
+        self.tokens = list(tokens)
+
+
+class User:
+    '''One virtual user: a keep-alive HTTP connection and the samples it recorded.'''
+
+    def __init__(self, number, host, port, timeout=30):
+        self.number = number
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.samples = [] # (step, status, seconds, finished_at); status 0 = transport error
+        self.recording = True
+        self._connection = None
+
+    def request(self, step, method, path, body=None, headers=None):
+        if self._connection is None:
+            self._connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        started = time.perf_counter()
+        try:
+            self._connection.request(method, path, body=body, headers=headers or {})
+            response = self._connection.getresponse()
+            data = response.read()
+            status = response.status
+            if response.getheader('Connection', '').lower() == 'close' or response.version == 10:
+                self.close()
+        except (http.client.HTTPException, OSError):
+            self.close()
+            status, data = 0, b''
+        elapsed = time.perf_counter() - started
+        if self.recording:
+            self.samples.append((step, status, elapsed, time.monotonic()))
+        try:
+            payload = json.loads(data) if data and data[:1] in (b'{', b'[') else None
+        except ValueError:
+            payload = None
+        return status, payload
+
+    def get(self, step, path, headers=None):
+        return self.request(step, 'GET', path, headers=headers)
+
+    def delete(self, step, path, headers=None):
+        return self.request(step, 'DELETE', path, headers=headers)
+
+    def post_json(self, step, path, body, headers=None):
+        return self._send_json(step, 'POST', path, body, headers)
+
+    def patch_json(self, step, path, body, headers=None):
+        return self._send_json(step, 'PATCH', path, body, headers)
+
+    def _send_json(self, step, method, path, body, headers):
+        headers = dict(headers or {}, **{'Content-Type': 'application/json'})
+        return self.request(step, method, path, json.dumps(body).encode('utf-8'), headers)
+
+    def post_form(self, step, path, fields, headers=None):
+        headers = dict(headers or {}, **{'Content-Type': 'application/x-www-form-urlencoded'})
+        return self.request(step, 'POST', path, urlencode(fields).encode('utf-8'), headers)
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(port, path, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('app exited with status %d while starting' % process.returncode)
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', path)
+            if connection.getresponse().status == 200:
+                return
+        except (http.client.HTTPException, OSError):
+            pass
+        finally:
+            connection.close()
+        time.sleep(0.5)
+    raise RuntimeError('app did not answer %s within %d seconds' % (path, timeout))
+
+
+def percentile(sorted_values, p):
+    '''Nearest-rank percentile of an already sorted list.'''
+    if not sorted_values:
+        return None
+    rank = max(int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(samples, seconds):
+    latencies = sorted(sample[2] * 1000 for sample in samples)
+    errors = sum(1 for sample in samples if not 200 <= sample[1] < 400)
+    summary = {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'rps': round(len(samples) / seconds, 2) if seconds else 0.0,
+        'latency_ms': {'p%d' % p: round(percentile(latencies, p), 2) if latencies else None for p in PERCENTILES},
+    }
+    summary['latency_ms']['mean'] = round(sum(latencies) / len(latencies), 2) if latencies else None
+    summary['latency_ms']['max'] = round(latencies[-1], 2) if latencies else None
+    statuses = defaultdict(int)
+    for sample in samples:
+        statuses[str(sample[1])] += 1
+    summary['statuses'] = dict(sorted(statuses.items()))
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=HERE,
+                                       stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_users(scenario, context, port, users, warmup, duration):
+    '''Runs users threads for warmup + duration seconds; returns the samples of the measured window.'''
+    started = time.monotonic()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+    pool = [User(number, '127.0.0.1', port) for number in range(users)]
+
+    def loop(user):
+        rng = random.Random(user.number)
+        while time.monotonic() < stop_at:
+            try:
+                scenario(user, rng, context)
+            except Exception as error: # a scenario bug must not silently kill the user
+                user.samples.append(('scenario error: %s' % type(error).__name__, 0, 0.0, time.monotonic()))
+        user.close()
+
+    threads = [threading.Thread(target=loop, args=(user,), daemon=True) for user in pool]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [sample for user in pool for sample in user.samples if measure_from <= sample[3] <= stop_at]
+
+
+def run(app, users, duration, warmup, size, database=None, boot_timeout=180):
+    workdir = tempfile.mkdtemp(prefix='loadtest-%s-' % app)
+    database = database or 'sqlite:///' + os.path.join(workdir, app + '.db')
+    port = free_port()
+    env = dict(os.environ)
+    stub = None
+    context = Context(size)
+    if app == 'coffee_shop':
+        from jwt_stub import StubAuth0, MANAGER_PERMISSIONS
+        stub = StubAuth0().start()
+        env['AUTH0_JWKS_URL'] = stub.jwks_url
+        context.tokens = [stub.mint(MANAGER_PERMISSIONS) for _ in range(users)]
+
+    process = subprocess.Popen([sys.executable, os.path.join(HERE, 'serve.py'), app, '--port', str(port),
+                                '--database', database, '--size', str(size)],
+                               env=env, stdout=subprocess.DEVNULL)
+    try:
+        wait_until_ready(port, READY_PATHS[app], process, boot_timeout)
+        samples = run_users(SCENARIOS[app], context, port, users, warmup, duration)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        if stub is not None:
+            stub.stop()
+
+    steps = defaultdict(list)
+    for sample in samples:
+        steps[sample[0]].append(sample)
+    report = {
+        'app': app,
+        'commit': git_commit(),
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'users': users,
+        'duration_s': duration,
+        'warmup_s': warmup,
+        'size': size,
+        'database': database.split('://')[0],
+    }
+    report.update(summarize(samples, duration))
+    report['steps'] = {step: summarize(step_samples, duration) for step, step_samples in sorted(steps.items())}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('app', choices=sorted(SCENARIOS) + ['all'])
+    parser.add_argument('--users', type=int, default=10, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds run before measuring')
+    parser.add_argument('--size', type=int, help='rows seeded (venues, questions or drinks)')
+    parser.add_argument('--database', help='SQLAlchemy URL of a scratch database to use instead of SQLite; '
+                                           'it is dropped and re-seeded')
+    parser.add_argument('--report', help='JSON file to write, default loadtest-<app>.json')
+    args = parser.parse_args()
+
+    apps = sorted(SCENARIOS) if args.app == 'all' else [args.app]
+    for app in apps:
+        report = run(app, args.users, args.duration, args.warmup, args.size or DEFAULT_SIZES[app], args.database)
+        path = args.report if args.report and len(apps) == 1 else 'loadtest-%s.json' % app
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+        latency = report['latency_ms']
+        print('%-12s %8.1f rps  p50 %s ms  p95 %s ms  p99 %s ms  errors %.2f%%  -> %s' % (
+            app, report['rps'], latency['p50'], latency['p95'], latency['p99'], report['error_rate'] * 100, path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+'''
+What one virtual user does in each app.
+
+A scenario is called over and over until the run ends. It gets a User (see
+loadtest.py), a random.Random owned by that user and the run's Context. Each
+request is recorded under the step name passed to the User, and those names
+become the per-endpoint rows of the report.
+'''
+
+import uuid
+
+
+def fyyur_visitor(user, rng, context):
+    '''Browses the venue directory, a venue, the artists, the shows and searches venues.'''
+    num_artists = max(context.size // 10, 1)
+    user.get('venues', '/venues')
+    user.get('venue', '/venues/%d' % rng.randint(1, context.size))
+    user.get('artists', '/artists')
+    user.get('artist', '/artists/%d' % rng.randint(1, num_artists))
+    user.get('shows', '/shows')
+    user.post_form('search venues', '/venues/search', {'search_term': 'Venue %d' % rng.randrange(context.size)})
+
+
+def trivia_player(user, rng, context):
+    '''Lists and searches questions, then plays a short quiz session.'''
+    user.get('questions', '/questions?page=%d' % rng.randint(1, 10))
+    user.get('categories', '/categories')
+    user.post_json('search', '/questions/search', {'searchTerm': 'Question %d ' % rng.randint(1, context.size)})
+    status, body = user.post_json('start quiz', '/quizzes/sessions', {'quiz_category': {'id': rng.randint(0, 6)}})
+    if status != 200:
+        return
+    session = '/quizzes/sessions/%s' % body['session_id']
+    for _ in range(5):
+        user.post_json('next question', session, {})
+    user.delete('end quiz', session)
+
+
+def coffee_shop_barista(user, rng, context):
+    '''Reads both menus, then creates, renames and deletes a drink.'''
+    headers = {'Authorization': 'Bearer ' + context.tokens[user.number % len(context.tokens)]}
+    user.get('drinks', '/drinks')
+    user.get('drinks-detail', '/drinks-detail', headers)
+    status, body = user.post_json('create drink', '/drinks', {
+        'title': 'Load %s' % uuid.uuid4().hex[:12],
+        'recipe': [{'name': 'water', 'color': 'blue', 'parts': 1}, {'name': 'coffee', 'color': 'brown', 'parts': 2}],
+    }, headers)
+    if status != 200:
+        return
+    path = '/drinks/%d' % body['drink']['id']
+    user.patch_json('patch drink', path, {'title': 'Load %s' % uuid.uuid4().hex[:12]}, headers)
+    user.delete('delete drink', path, headers)
+
+
+SCENARIOS = {
+    'fyyur': fyyur_visitor,
+    'trivia': trivia_player,
+    'coffee_shop': coffee_shop_barista,
+}
+
+# polled until the freshly started app answers 200
+READY_PATHS = {
+    'fyyur': '/',
+    'trivia': '/categories',
+    'coffee_shop': '/drinks',
+}
@@ -0,0 +1,103 @@
+'''
+Seeds a database for one app and serves the app on localhost.
+
+    python serve.py trivia --port 5101 --database sqlite:////tmp/trivia.db --size 10000
+
+loadtest.py starts this in a subprocess. It can also be run by hand to
+explore a seeded app. The database is dropped and re-created, so never point
+--database at data you want to keep.
+'''
+
+import argparse
+import os
+import random
+import socket
+import sys
+
+from werkzeug.serving import WSGIRequestHandler
+
+PROJECTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIRS = {
+    'fyyur': os.path.join(PROJECTS, '01_fyyur', 'starter_code'),
+    'trivia': os.path.join(PROJECTS, '02_trivia_api', 'starter', 'backend'),
+    'coffee_shop': os.path.join(PROJECTS, '03_coffee_shop_full_stack', 'starter_code', 'backend'),
+}
+TRIVIA_CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+INGREDIENTS = [('water', 'blue'), ('milk', 'grey'), ('coffee', 'brown'), ('foam', 'white'), ('syrup', 'amber')]
+
+
+def fyyur(database, size):
+    '''size venues, a tenth as many artists and four shows per venue.'''
+    os.environ['DATABASE_URL'] = database
+    from app import app
+    import benchmark
+    with app.app_context():
+        benchmark.seed(size)
+    return app
+
+
+def trivia(database, size):
+    '''size questions spread over the six standard categories.'''
+    from flaskr import create_app
+    from models import db, Question, Category
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database})
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(Category.__table__.insert(), [{'type': type} for type in TRIVIA_CATEGORIES])
+        db.session.execute(Question.__table__.insert(), [{
+            'question': 'Question %d about topic %d' % (i, i % 97),
+            'answer': 'Answer %d' % i,
+            'category': i % len(TRIVIA_CATEGORIES) + 1,
+            'difficulty': i % 5 + 1,
+        } for i in range(1, size + 1)])
+        db.session.commit()
+    return app
+
+
+def coffee_shop(database, size):
+    '''size drinks of one to three ingredients.'''
+    os.environ['DATABASE_URL'] = database
+    from src.api import app
+    from src.database.models import db, db_drop_and_create_all, drink_cache, Drink
+    rng = random.Random(size)
+    with app.app_context():
+        db_drop_and_create_all()
+        db.session.add_all([Drink(title='Drink %d' % i, recipe=[
+            {'name': name, 'color': color, 'parts': rng.randint(1, 3)}
+            for name, color in rng.sample(INGREDIENTS, rng.randint(1, 3))
+        ]) for i in range(size)])
+        db.session.commit()
+        drink_cache.invalidate()
+    return app
+
+
+class NoDelayRequestHandler(WSGIRequestHandler):
+    # the dev server writes headers and body separately; with Nagle on, every
+    # keep-alive response would stall ~40ms waiting for the client's delayed ACK
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+SEEDERS = {'fyyur': fyyur, 'trivia': trivia, 'coffee_shop': coffee_shop}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('app', choices=sorted(SEEDERS))
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--database', required=True, help='SQLAlchemy URL, dropped and re-seeded')
+    parser.add_argument('--size', type=int, default=1000)
+    args = parser.parse_args()
+
+    # the apps import their modules (models, search, ...) as top-level names
+    os.chdir(APP_DIRS[args.app])
+    sys.path.insert(0, APP_DIRS[args.app])
+    app = SEEDERS[args.app](args.database, args.size)
+    app.run(host='127.0.0.1', port=args.port, threaded=True, debug=False, use_reloader=False,
+            request_handler=NoDelayRequestHandler)
+
+
+if __name__ == '__main__':
+    main()
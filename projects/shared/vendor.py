@@ -0,0 +1,61 @@
+'''
+Copies the shared modules into the apps that vendor them.
+
+    python vendor.py          # overwrite the app copies with the originals here
+    python vendor.py --check  # exit 1 if any app copy differs from its original
+
+Each app deploys on its own, from its own directory with its own requirements.txt,
+so instead of importing from here it carries a byte-identical copy of each module.
+'''
+
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PROJECTS = os.path.dirname(HERE)
+
+# original in this directory -> vendored copies, relative to projects/
+VENDORED = {
+    'metrics.py': [
+        '01_fyyur/starter_code/metrics.py',
+        '02_trivia_api/starter/backend/metrics.py',
+        '03_coffee_shop_full_stack/starter_code/backend/src/metrics.py',
+    ],
+    'pool.py': [
+        '01_fyyur/starter_code/pool.py',
+        '02_trivia_api/starter/backend/pool.py',
+        '03_coffee_shop_full_stack/starter_code/backend/src/database/pool.py',
+    ],
+    'trigram.py': [
+        '01_fyyur/starter_code/trigram.py',
+        '02_trivia_api/starter/backend/trigram.py',
+    ],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--check', action='store_true', help='only report copies that differ')
+    args = parser.parse_args()
+
+    stale = []
+    for name, copies in sorted(VENDORED.items()):
+        original = os.path.join(HERE, name)
+        for copy in copies:
+            path = os.path.join(PROJECTS, copy)
+            if os.path.exists(path) and filecmp.cmp(original, path, shallow=False):
+                continue
+            stale.append(copy)
+            if not args.check:
+                shutil.copyfile(original, path)
+    for copy in stale:
+        print(('out of date: %s' if args.check else 'updated: %s') % copy)
+    if args.check and stale:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()